@@ -9,29 +9,62 @@ from datetime import datetime
 from services.llm_service_api import LLMService
 from services.whisper_service import WhisperService
 from services.tts_service import TTSService
+from services.model_registry import ModelRegistry
+from services.intent_classifier import IntentClassifier, DEFAULT_INTENTS_FILE
 
 class BatchAudioProcessor:
-    def __init__(self, input_folder="input", output_folder="output"):
+    def __init__(self, input_folder="input", output_folder="output", asr_batch_size=8, faq_fast_path=None):
+        """
+        Args:
+            input_folder: Folder with the recordings
+            output_folder: Folder for results and response audio
+            asr_batch_size: Files transcribed per Whisper batch (batched text
+                can differ slightly from single-file transcription, see
+                WhisperService.transcribe_batch)
+            faq_fast_path: Answer clear FAQ questions from templates instead
+                of the LLM (default: off, unless FAQ_FAST_PATH=1 is set)
+        """
         print("="*60)
         print("🎙️  Batch Audio Processor")
         print("="*60)
         
         self.input_folder = Path(input_folder)
         self.output_folder = Path(output_folder)
+        self.asr_batch_size = asr_batch_size
         
         # Create folders if they don't exist
         self.input_folder.mkdir(exist_ok=True)
         self.output_folder.mkdir(exist_ok=True)
         (self.output_folder / "audio").mkdir(exist_ok=True)
         
-        # Initialize services
-        print("\nInitializing services...")
-        self.llm_service = LLMService()
-        self.whisper_service = WhisperService()
-        self.tts_service = TTSService()
+        # Models load in parallel in the background; the first use waits for its model
+        print("\nLoading services in the background...")
+        self.models = ModelRegistry(warmup=False)
+        self.models.register("llm", LLMService)
+        self.models.register("asr", WhisperService)
+        # Persist speaker latents so re-runs over the same recordings skip the XTTS encoders
+        self.models.register("tts", lambda: TTSService(latent_cache_dir=self.output_folder / "latent_cache"))
+        self.models.preload()
+        if faq_fast_path is None:
+            faq_fast_path = os.getenv("FAQ_FAST_PATH", "0") == "1"
+        self.intent_classifier = (
+            IntentClassifier(os.getenv("FAQ_FILE") or DEFAULT_INTENTS_FILE) if faq_fast_path else None
+        )
         
         print("✅ Batch processor ready!\n")
     
+    @property
+    def llm_service(self):
+        return self.models.get("llm")
+    
+    @property
+    def whisper_service(self):
+        return self.models.get("asr")
+    
+    @property
+    def tts_service(self):
+        return self.models.get("tts")
+    
     def get_audio_files(self):
         """Get all audio files from input folder"""
         audio_extensions = ['.wav', '.mp3', '.webm', '.ogg', '.m4a', '.flac']
@@ -42,8 +75,14 @@ class BatchAudioProcessor:
         
         return sorted(audio_files)
     
-    def process_file(self, audio_file, index):
-        """Process a single audio file"""
+    def process_file(self, audio_file, index, transcription=None):
+        """Process a single audio file
+        
+        Args:
+            audio_file: Path of the recording
+            index: 1-based position in the batch
+            transcription: (transcript, language) from transcribe_all, if available
+        """
         print(f"\n{'='*60}")
         print(f"Processing [{index}]: {audio_file.name}")
         print(f"{'='*60}")
@@ -58,9 +97,11 @@ class BatchAudioProcessor:
         }
         
         try:
-            # 1. Transcribe
-            print("🔄 Transcribing...")
-            transcript, language = self.whisper_service.transcribe(str(audio_file))
+            # 1. Transcribe (unless already done in the batched pass)
+            if transcription is None:
+                print("🔄 Transcribing...")
+                transcription = self.whisper_service.transcribe(str(audio_file))
+            transcript, language = transcription
             result["transcript"] = transcript
             result["language"] = language
             
@@ -68,9 +109,14 @@ class BatchAudioProcessor:
             print(f"🌐 Language: {lang_names.get(language, language)}")
             print(f"📝 Transcript: {transcript}")
             
-            # 2. Generate LLM response
-            print("🤔 Generating response...")
-            response = self.llm_service.generate_response(transcript, language=language)
+            # 2. Answer clear FAQ questions from templates, everything else with the LLM
+            faq = self.intent_classifier.match(transcript, language) if self.intent_classifier else None
+            if faq:
+                response = faq.answer
+                result["intent"] = faq.intent
+            else:
+                print("🤔 Generating response...")
+                response = self.llm_service.generate_response(transcript, language=language)
             result["response"] = response
             print(f"💬 Response: {response}")
             
@@ -110,11 +156,13 @@ class BatchAudioProcessor:
         print(f"📂 Input folder: {self.input_folder.absolute()}")
         print(f"📂 Output folder: {self.output_folder.absolute()}")
         
-        # Process each file
+        # Transcribe a group of files in one batch, then LLM + TTS for each
+        # file of the group, so only one group's audio is in memory at a time
         results = []
-        for i, audio_file in enumerate(audio_files, 1):
-            result = self.process_file(audio_file, i)
-            results.append(result)
+        for group in self.transcribe_all(audio_files):
+            for audio_file, transcription in group:
+                result = self.process_file(audio_file, len(results) + 1, transcription)
+                results.append(result)
         
         # Save results
         self.save_results(results)
@@ -122,6 +170,27 @@ class BatchAudioProcessor:
         # Print summary
         self.print_summary(results)
     
+    def transcribe_all(self, audio_files):
+        """Batched transcription, asr_batch_size files at a time
+        
+        Yields one list of (file, transcription) per group; None
+        transcriptions are retried per file.
+        """
+        print(f"\n{'='*60}")
+        print(f"🔄 Transcribing {len(audio_files)} file(s) in batches of {self.asr_batch_size}...")
+        print(f"{'='*60}")
+        
+        for start in range(0, len(audio_files), self.asr_batch_size):
+            group = audio_files[start:start + self.asr_batch_size]
+            try:
+                transcriptions = self.whisper_service.transcribe_batch(
+                    [str(f) for f in group], batch_size=self.asr_batch_size
+                )
+            except Exception as e:
+                print(f"⚠️ Batched transcription failed ({e}), falling back to one file at a time")
+                transcriptions = [None] * len(group)
+            yield list(zip(group, transcriptions))
+    
     def save_results(self, results):
         """Save all results to files"""
         print(f"\n{'='*60}")
@@ -186,7 +255,9 @@ class BatchAudioProcessor:
     
     def cleanup(self):
         """Clean up resources"""
-        self.tts_service.cleanup()
+        tts_service = self.models.loaded().get("tts")
+        if tts_service:
+            tts_service.cleanup()
 
 def main():
     """Main entry point"""
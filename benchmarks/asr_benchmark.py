@@ -0,0 +1,133 @@
+"""
+ASR Backend Benchmark
+Compare Whisper backends side by side (speed and WER) on the same audio set
+
+Usage:
+    python benchmarks/asr_benchmark.py input/ \
+        --config openai:large-v3 --config faster-whisper:large-v3:int8 --config faster-whisper:small:int8
+
+Reference transcripts are read from a .txt file next to each audio file
+(same name). Files without one are timed but left out of the WER.
+"""
+import argparse
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.audio_utils import decode_audio
+from services.whisper_service import WhisperService
+
+AUDIO_EXTENSIONS = ['.wav', '.mp3', '.webm', '.ogg', '.m4a', '.flac']
+
+
+def normalize_words(text):
+    # Keep letters, digits and combining marks (Devanagari/Telugu vowel signs)
+    return "".join(
+        ch if unicodedata.category(ch)[0] in "LNM" else " " for ch in text.lower()
+    ).split()
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance between two transcripts"""
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,                           # deletion
+                current[j - 1] + 1,                        # insertion
+                previous[j - 1] + (ref_word != hyp_word)   # substitution
+            ))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def parse_config(spec):
+    """backend:model[:compute_type]"""
+    parts = spec.split(":")
+    if len(parts) < 2:
+        raise argparse.ArgumentTypeError(f"Expected backend:model[:compute_type], got '{spec}'")
+    config = {"backend": parts[0], "model_size": parts[1]}
+    if len(parts) > 2:
+        config["compute_type"] = parts[2]
+    return config
+
+
+def run(config, clips):
+    label = ":".join(config.values())
+    start = time.perf_counter()
+    service = WhisperService(**config)
+    load_time = time.perf_counter() - start
+
+    # One untimed pass so lazy initialization isn't billed to the first file
+    service.transcribe(clips[0][1][:16000 * 5])
+
+    total_audio = total_time = 0.0
+    errors = words = 0
+    for path, audio, reference in clips:
+        start = time.perf_counter()
+        text, language = service.transcribe(audio)
+        elapsed = time.perf_counter() - start
+        total_audio += len(audio) / 16000
+        total_time += elapsed
+        line = f"   {path.name}: {elapsed:.2f}s [{language}] {text[:60]}"
+        if reference is not None:
+            e, n = word_errors(reference, text)
+            errors += e
+            words += n
+            line += f" (WER {e / max(n, 1):.1%})"
+        print(line)
+
+    return {
+        "config": label,
+        "load_s": load_time,
+        "rtf": total_time / max(total_audio, 1e-6),
+        "wer": errors / words if words else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Whisper backends on the same audio set")
+    parser.add_argument("folder", help="Folder with audio files (and optional .txt references)")
+    parser.add_argument("--config", action="append", type=parse_config,
+                        help="backend:model[:compute_type], repeatable")
+    args = parser.parse_args()
+    configs = args.config or [
+        parse_config("openai:large-v3"),
+        parse_config("faster-whisper:large-v3:int8"),
+    ]
+
+    folder = Path(args.folder)
+    files = sorted(p for p in folder.iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS)
+    if not files:
+        print(f"⚠️  No audio files found in '{folder}'")
+        return
+
+    # Decode once so every backend sees exactly the same samples
+    clips = []
+    for path in files:
+        reference_file = path.with_suffix(".txt")
+        reference = reference_file.read_text(encoding="utf-8") if reference_file.exists() else None
+        clips.append((path, decode_audio(path), reference))
+    print(f"📁 {len(clips)} file(s), {sum(len(a) for _, a, _ in clips) / 16000:.1f}s of audio\n")
+
+    results = []
+    for config in configs:
+        print(f"{'='*60}\n▶ {':'.join(config.values())}\n{'='*60}")
+        results.append(run(config, clips))
+
+    print(f"\n{'='*60}")
+    print(f"{'Config':<32}{'Load (s)':>9}{'RTF':>8}{'WER':>9}")
+    print(f"{'-'*58}")
+    for r in results:
+        wer = f"{r['wer']:.1%}" if r["wer"] is not None else "n/a"
+        print(f"{r['config']:<32}{r['load_s']:>9.1f}{r['rtf']:>8.2f}{wer:>9}")
+    print("RTF = processing time / audio duration (lower is faster; < 1 is faster than real time)")
+
+
+if __name__ == "__main__":
+    main()
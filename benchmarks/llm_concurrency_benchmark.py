@@ -0,0 +1,91 @@
+"""
+In-process LLM Concurrency Benchmark
+Total throughput of services/llm_service.py with several simultaneous callers,
+for different instance/thread splits of the same cores
+
+Usage:
+    python benchmarks/llm_concurrency_benchmark.py --callers 8 --config 1x8 --config 2x4 --config 4x2
+"""
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.llm_service import LLMService
+
+QUERIES = [
+    "My electricity bill is very high this month, why?",
+    "There is no power in my area since morning.",
+    "How do I apply for a new connection?",
+    "My meter is not working properly.",
+    "What is the due date for my bill payment?",
+    "I want to increase the load of my connection.",
+    "I paid my bill but it still shows pending.",
+    "When will the power cut in my street be fixed?",
+]
+
+
+def parse_config(spec):
+    """<instances>x<threads per instance>"""
+    instances, _, threads = spec.partition("x")
+    return int(instances), int(threads)
+
+
+def run(model_path, instances, threads, callers, max_tokens):
+    service = LLMService(model_path=model_path, instances=instances, n_threads=threads)
+    service.warmup()
+
+    counts = [0] * callers
+    first_token = [None] * callers
+
+    def caller(i):
+        start = time.perf_counter()
+        for _ in service.generate_stream(QUERIES[i % len(QUERIES)], max_tokens=max_tokens):
+            if first_token[i] is None:
+                first_token[i] = time.perf_counter() - start
+            counts[i] += 1
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    ttfts = [t for t in first_token if t is not None]
+
+    return {
+        "config": f"{instances}x{threads}",
+        "tokens": sum(counts),
+        "seconds": elapsed,
+        "tok_s": sum(counts) / elapsed,
+        "avg_ttft": sum(ttfts) / max(len(ttfts), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare instance/thread splits under concurrent load")
+    parser.add_argument("--model", default="models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf")
+    parser.add_argument("--callers", type=int, default=8, help="Simultaneous requests")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--config", action="append", type=parse_config,
+                        help="<instances>x<threads per instance>, repeatable")
+    args = parser.parse_args()
+    configs = args.config or [(1, 4), (2, 2)]
+
+    results = [run(args.model, instances, threads, args.callers, args.max_tokens) for instances, threads in configs]
+
+    print(f"\n{'='*60}")
+    print(f"{args.callers} simultaneous callers, up to {args.max_tokens} tokens each")
+    print(f"{'Config':<10}{'Tokens':>8}{'Time (s)':>10}{'Total tok/s':>13}{'Avg TTFT (s)':>14}")
+    print(f"{'-'*55}")
+    for r in results:
+        print(f"{r['config']:<10}{r['tokens']:>8}{r['seconds']:>10.1f}{r['tok_s']:>13.1f}{r['avg_ttft']:>14.2f}")
+    print("Config = instances x threads per instance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Speculative Decoding Benchmark
+Decode rate of services/llm_service.py with and without speculative decoding
+on recorded customer queries
+
+Queries come from a batch run's results.json (transcript + detected language),
+a text file with one query per line, or a built-in sample set.
+
+Usage:
+    python benchmarks/speculative_benchmark.py --queries output/results.json
+    python benchmarks/speculative_benchmark.py --mode prompt-lookup:2 --mode prompt-lookup:4 \\
+        --mode draft-model:4 --draft-model models/Llama-3.2-1B-Instruct-Q4_K_M.gguf
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.llm_service import LLMService
+
+QUERIES = [
+    ("My electricity bill is very high this month, why?", "en"),
+    ("There is no power in my area since morning.", "en"),
+    ("How do I apply for a new connection?", "en"),
+    ("My meter is not working properly.", "en"),
+    ("मेरा बिजली का बिल इस महीने बहुत ज़्यादा आया है।", "hi"),
+    ("सुबह से हमारे इलाके में बिजली नहीं है।", "hi"),
+    ("నా కరెంట్ బిల్లు ఈ నెల చాలా ఎక్కువ వచ్చింది.", "te"),
+    ("కొత్త కనెక్షన్ కోసం ఎలా అప్లై చేయాలి?", "te"),
+]
+
+
+def load_queries(path):
+    """[(query, language)] from results.json or a one-query-per-line text file"""
+    if path is None:
+        return QUERIES
+    path = Path(path)
+    if path.suffix == ".json":
+        with open(path, encoding="utf-8") as f:
+            results = json.load(f)
+        return [(r["transcript"], r.get("language") or "en") for r in results if r.get("transcript")]
+    with open(path, encoding="utf-8") as f:
+        return [(line.strip(), "en") for line in f if line.strip()]
+
+
+def parse_mode(spec):
+    """off, prompt-lookup[:<draft tokens>] or draft-model[:<draft tokens>]"""
+    mode, _, tokens = spec.partition(":")
+    return (None if mode == "off" else mode), int(tokens or 2)
+
+
+def run(args, queries, mode, draft_tokens):
+    service = LLMService(model_path=args.model, warm_languages=("en", "hi", "te"), n_threads=args.threads,
+                         speculative=mode, draft_tokens=draft_tokens, draft_model_path=args.draft_model)
+    service.warmup()
+
+    outputs = []
+    start = time.perf_counter()
+    for query, language in queries:
+        # Greedy, so every mode should produce the same answers
+        outputs.append(service.generate_response(query, language=language, max_tokens=args.max_tokens,
+                                                 temperature=0.0))
+    elapsed = time.perf_counter() - start
+
+    speed = service.speed()
+    return {
+        "mode": f"{mode}:{draft_tokens}" if mode else "off",
+        "seconds": elapsed,
+        "tok_s": speed["tok_s"],
+        "acceptance": speed["draft_acceptance"],
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare speculative decoding modes")
+    parser.add_argument("--model", default="models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf")
+    parser.add_argument("--draft-model", help="Small GGUF with the same vocabulary, for draft-model modes")
+    parser.add_argument("--queries", help="results.json from batch_processor.py, or a text file (default: built-in)")
+    parser.add_argument("--limit", type=int, default=20, help="Queries to run")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--mode", action="append", type=parse_mode,
+                        help="off, prompt-lookup[:N] or draft-model[:N] (N = draft tokens), repeatable")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)[:args.limit]
+    modes = [(None, 0)] + [m for m in (args.mode or [("prompt-lookup", 2)]) if m[0] is not None]
+    results = [run(args, queries, mode, draft_tokens) for mode, draft_tokens in modes]
+
+    baseline = results[0]
+    print(f"\n{'='*66}")
+    print(f"{len(queries)} queries, up to {args.max_tokens} tokens each, {args.threads} threads")
+    print(f"{'Mode':<18}{'Time (s)':>10}{'tok/s':>9}{'Accepted':>10}{'Speed-up':>10}{'Same output':>13}")
+    print(f"{'-'*70}")
+    for r in results:
+        acceptance = f"{r['acceptance']:.0%}" if r["acceptance"] is not None else "-"
+        same = sum(a == b for a, b in zip(r["outputs"], baseline["outputs"]))
+        print(f"{r['mode']:<18}{r['seconds']:>10.1f}{r['tok_s'] or 0:>9.1f}{acceptance:>10}"
+              f"{baseline['seconds'] / r['seconds']:>9.2f}x{f'{same}/{len(queries)}':>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+VAD Scoring Micro-benchmark
+Time per-window is_speech() calls vs. the one-pass VADService.speech_probs()
+
+Usage:
+    python benchmarks/vad_benchmark.py [audio.wav] [--seconds 60] [--repeat 3]
+
+Without an audio file, a synthetic signal (noise bursts between silences) is used.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.audio_utils import decode_audio
+from services.vad_service import VADService
+
+
+def synthetic_audio(seconds, sample_rate=16000):
+    rng = np.random.default_rng(0)
+    audio = rng.normal(0, 0.001, int(seconds * sample_rate)).astype(np.float32)
+    for start in range(0, len(audio), 4 * sample_rate):
+        audio[start:start + 2 * sample_rate] += rng.normal(0, 0.1, len(audio[start:start + 2 * sample_rate]))
+    return audio
+
+
+def per_window(vad, audio):
+    """Calling the model window by window, one .item() each"""
+    window = vad.window_size
+    vad.model.reset_states()
+    return np.array([vad.is_speech(audio[i:i + window])[1] for i in range(0, len(audio) - window + 1, window)])
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare VAD scoring paths")
+    parser.add_argument("audio", nargs="?", help="Audio file (default: synthetic signal)")
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the synthetic signal")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    audio = decode_audio(args.audio) if args.audio else synthetic_audio(args.seconds)
+    duration = len(audio) / 16000
+    vad = VADService()
+
+    old_time, old_probs = best_time(lambda: per_window(vad, audio), args.repeat)
+    new_time, new_probs = best_time(lambda: vad.speech_probs(audio), args.repeat)
+
+    print(f"\n{duration:.0f}s of audio, {len(new_probs)} windows")
+    print(f"{'Path':<22}{'Time (ms)':>12}{'ms / audio s':>15}")
+    print(f"{'-'*49}")
+    print(f"{'per-window is_speech':<22}{old_time * 1000:>12.1f}{old_time * 1000 / duration:>15.2f}")
+    print(f"{'speech_probs':<22}{new_time * 1000:>12.1f}{new_time * 1000 / duration:>15.2f}")
+    print(f"Speed-up: {old_time / new_time:.1f}x, max probability difference: "
+          f"{np.abs(old_probs[:len(new_probs)] - new_probs).max():.4f}")
+
+
+if __name__ == "__main__":
+    main()
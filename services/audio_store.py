@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+NAME_PATTERN = re.compile(r"^[0-9a-f]{32}\.wav$")
+
+
+class AudioStore:
+    """Content-addressed store for generated response audio
+
+    Files are named after a hash of their contents, so identical responses
+    share one file, names never collide, and a name always refers to the same
+    bytes (which makes them safe to cache forever on the client side).
+    Files older than max_age are deleted, and the oldest files go first once
+    the store grows past max_bytes.
+
+    Args:
+        directory: Folder holding the audio files
+        max_bytes: Size cap for the whole store
+        max_age: Seconds a file is kept after it was last written or reused
+        on_evict: Optional callback(name) for each evicted file
+    """
+    def __init__(self, directory="audio_store", max_bytes=500 * 1024 * 1024, max_age=24 * 3600, on_evict=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.on_evict = on_evict
+        self.lock = threading.Lock()
+
+        # Leftovers from an interrupted run
+        for leftover in self.directory.glob(".tmp-*"):
+            leftover.unlink(missing_ok=True)
+        self.evict()
+
+    def temp_path(self):
+        """Path to synthesize into before the file is added with put()"""
+        return str(self.directory / f".tmp-{uuid.uuid4().hex}.wav")
+
+    def put(self, file_path):
+        """Move a finished file into the store and return its name"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        name = f"{digest.hexdigest()[:32]}.wav"
+        target = self.directory / name
+
+        with self.lock:
+            if target.exists():
+                os.remove(file_path)
+                os.utime(target)
+            else:
+                os.replace(file_path, target)
+        self.evict()
+        return name
+
+    def path(self, name):
+        """Path of a stored file, or None for unknown or malformed names"""
+        if not NAME_PATTERN.match(name):
+            return None
+        target = self.directory / name
+        return target if target.exists() else None
+
+    def touch(self, name):
+        """Mark a file as recently used so eviction keeps it"""
+        target = self.path(name)
+        if target is not None:
+            os.utime(target)
+        return target is not None
+
+    def evict(self):
+        """Delete expired files, then the oldest ones until under max_bytes"""
+        with self.lock:
+            now = time.time()
+            files = []
+            for entry in os.scandir(self.directory):
+                if not NAME_PATTERN.match(entry.name):
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.name))
+            files.sort()
+
+            total = sum(size for _, size, _ in files)
+            evicted = []
+            for mtime, size, name in files:
+                if now - mtime <= self.max_age and total <= self.max_bytes:
+                    break
+                (self.directory / name).unlink(missing_ok=True)
+                total -= size
+                evicted.append(name)
+
+        if evicted:
+            print(f"🧹 Evicted {len(evicted)} audio file(s) from {self.directory}")
+            if self.on_evict:
+                for name in evicted:
+                    self.on_evict(name)
@@ -0,0 +1,154 @@
+import subprocess
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+import scipy.signal
+
+
+def decode_audio(source, sample_rate=16000):
+    """Decode any ffmpeg-readable audio to a mono float32 array, without temp files
+
+    ffmpeg reads the input from stdin (or the given path) and writes raw
+    float32 PCM to stdout, which becomes the NumPy buffer directly.
+
+    Args:
+        source: Encoded audio bytes (webm/ogg/wav/mp3...) or a file path.
+            Pass a path for MP4/M4A, which can't always be decoded from a pipe.
+        sample_rate: Output sample rate
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        input_arg, stdin = "pipe:0", bytes(source)
+    else:
+        input_arg, stdin = str(source), None
+
+    process = subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+            "-i", input_arg,
+            "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(sample_rate),
+            "pipe:1"
+        ],
+        input=stdin,
+        capture_output=True
+    )
+    if process.returncode != 0:
+        error = process.stderr.decode(errors="ignore").strip()
+        raise RuntimeError(f"ffmpeg could not decode audio: {error}")
+
+    # bytearray gives a writable buffer, so torch.from_numpy() works on the result
+    return np.frombuffer(bytearray(process.stdout), dtype=np.float32)
+
+
+# Filter length relative to the rate change, as in scipy.signal.resample_poly
+FILTER_HALF_LEN_FACTOR = 10
+
+
+@lru_cache(maxsize=16)
+def _polyphase_filter(src_rate, dst_rate):
+    """Anti-aliasing FIR filter for one (src_rate, dst_rate) pair, designed once"""
+    g = gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    max_rate = max(up, down)
+    half_len = FILTER_HALF_LEN_FACTOR * max_rate
+    taps = scipy.signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    taps = taps.astype(np.float32)
+    taps.setflags(write=False)
+    return up, down, half_len, taps
+
+
+def to_mono(audio):
+    """Downmix (samples, channels) audio into a new float32 array (the input is left untouched)"""
+    if audio.ndim == 1:
+        return audio
+    return audio.mean(axis=1, dtype=np.float32)
+
+
+def resample(audio, src_rate, dst_rate=16000, chunk_seconds=60):
+    """Polyphase resampling with a cached filter, chunked for long recordings
+
+    Long inputs are processed in chunks (with enough overlap on each side to
+    cover the filter) so memory stays bounded; chunk boundaries are aligned to
+    the decimation factor, which makes the output identical to resampling the
+    whole signal at once.
+
+    Args:
+        audio: 1-D float32 signal
+        src_rate: Input sample rate
+        dst_rate: Output sample rate
+        chunk_seconds: Input seconds per chunk
+    """
+    if src_rate == dst_rate:
+        return audio
+    up, down, half_len, taps = _polyphase_filter(src_rate, dst_rate)
+
+    n_in = len(audio)
+    n_out = -(-n_in * up // down)
+    chunk = max(int(chunk_seconds * src_rate) // down, 1) * down
+    if n_in <= chunk:
+        return scipy.signal.resample_poly(audio, up, down, window=taps).astype(np.float32, copy=False)
+
+    # Input samples of context needed on each side, rounded up to whole decimation steps
+    context = (-(-half_len // up) // down + 1) * down
+    out = np.empty(n_out, dtype=np.float32)
+    for start in range(0, n_in, chunk):
+        end = min(start + chunk, n_in)
+        lo, hi = max(start - context, 0), min(end + context, n_in)
+        block = scipy.signal.resample_poly(audio[lo:hi], up, down, window=taps)
+        skip = (start - lo) * up // down
+        out_start = start * up // down
+        out_end = n_out if end == n_in else end * up // down
+        out[out_start:out_end] = block[skip:skip + out_end - out_start]
+    return out
+
+
+def prepare_audio(audio, sample_rate, target_rate=16000):
+    """Mono float32 at target_rate, copying only when a step has to"""
+    audio = np.asarray(audio, dtype=np.float32)
+    audio = to_mono(audio)
+    audio = resample(audio, sample_rate, target_rate)
+    return np.ascontiguousarray(audio)
+
+
+class RingBuffer:
+    """Preallocated single-producer/single-consumer audio buffer
+
+    The producer (e.g. a sounddevice callback) only copies samples in and
+    then advances `written`; readers address samples by absolute position
+    behind it. Positions only grow and each is written by one thread, so no
+    lock is needed and the audio callback never allocates.
+
+    Args:
+        capacity: Samples held before the oldest are overwritten
+        dtype: Sample type
+    """
+    def __init__(self, capacity, dtype=np.float32):
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.written = 0
+
+    def reset(self):
+        self.written = 0
+
+    def write(self, samples):
+        n = len(samples)
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+        self.written += n
+
+    def read(self, start, n):
+        """n samples from absolute position start; a view unless they wrap around"""
+        if start < self.written - self.capacity:
+            raise ValueError("Samples were already overwritten")
+        offset = start % self.capacity
+        if offset + n <= self.capacity:
+            return self.buffer[offset:offset + n]
+        return np.concatenate([self.buffer[offset:], self.buffer[:offset + n - self.capacity]])
+
+    def contents(self):
+        """Every sample still held, oldest first"""
+        n = min(self.written, self.capacity)
+        return self.read(self.written - n, n)
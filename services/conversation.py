@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_tokens(text):
+    """Rough Llama 3 token count (UTF-8 bytes / 3; errs high for Latin text)"""
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+class Turn:
+    def __init__(self, user, assistant, tokens):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = tokens   # context tokens this turn occupies (headers included)
+
+
+class Conversation:
+    """One caller's dialogue, replayed into the prompt on every turn
+
+    Each turn's prompt is the previous prompt plus the last answer and the
+    new user turn. With cache_prompt on the same llama-server slot, only those
+    new tokens are prefilled. When the next turn would overflow the context,
+    the oldest turns are dropped until the conversation fits in `keep` of
+    the budget. Dropping in one larger step keeps the (re-prefilled) prefix
+    stable for the next several turns, instead of shifting it every turn.
+
+    With several llama-server replicas, slot ids are the same on every
+    replica but the cached history lives on one of them, so the
+    conversation remembers which replica served it and goes back there.
+
+    Args:
+        session_id: Caller/session identifier
+        slot: llama-server slot the conversation is bound to (None = server picks)
+        context_size: Context tokens available per slot (llama-server -c / -np)
+        keep: Fraction of context_size to trim down to when it fills up
+    """
+    def __init__(self, session_id, slot=None, context_size=2048, keep=0.6):
+        self.session_id = session_id
+        self.slot = slot
+        self.context_size = context_size
+        self.keep = keep
+        self.backend = None   # llama-server replica holding the history in its KV cache
+        self.turns = []
+        self.context_tokens = 0   # tokens in context after the last turn (system prompt + history)
+        self.last_used = time.monotonic()
+
+    def history(self, user_input, max_tokens):
+        """[(user, assistant), ...] to replay before user_input, trimmed to fit the context"""
+        self.last_used = time.monotonic()
+        needed = self.context_tokens + estimate_tokens(user_input) + max_tokens
+        if needed > self.context_size and self.turns:
+            dropped = 0
+            while self.turns and needed > self.context_size * self.keep:
+                turn = self.turns.pop(0)
+                needed -= turn.tokens
+                self.context_tokens -= turn.tokens
+                dropped += 1
+            print(f"✂️ Conversation {self.session_id}: dropped {dropped} old turn(s) to fit the context")
+        return [(turn.user, turn.assistant) for turn in self.turns]
+
+    def add_turn(self, user, assistant, prompt_tokens=None, generated_tokens=None):
+        """Record a finished turn
+
+        Args:
+            prompt_tokens: Prompt length the server reported for this turn
+            generated_tokens: Tokens the server generated for this turn
+        """
+        self.last_used = time.monotonic()
+        if generated_tokens is None:
+            generated_tokens = estimate_tokens(assistant)
+        if prompt_tokens is None or not self.turns:
+            # No server count, or the count also covers the system prompt
+            tokens = estimate_tokens(user) + generated_tokens
+            context_tokens = (prompt_tokens + generated_tokens) if prompt_tokens else self.context_tokens + tokens
+        else:
+            context_tokens = prompt_tokens + generated_tokens
+            tokens = max(context_tokens - self.context_tokens, 1)
+        self.turns.append(Turn(user, assistant, tokens))
+        self.context_tokens = context_tokens
+
+
+class ConversationStore:
+    """Conversations by session id, evicted once idle
+
+    Args:
+        idle_timeout: Seconds without a turn before a conversation is dropped
+        max_sessions: Conversations kept before the least recent is dropped
+        context_size: Context tokens per slot (see Conversation)
+        slots: llama-server slot ids to bind conversations to, spreading
+            them evenly (None = let the server pick by prompt similarity)
+    """
+    def __init__(self, idle_timeout=900, max_sessions=256, context_size=2048, slots=None):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.context_size = context_size
+        self.slots = list(slots) if slots else []
+        self.conversations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        """The session's conversation, started if new or expired"""
+        with self.lock:
+            self._evict_idle()
+            conversation = self.conversations.get(session_id)
+            if conversation is None:
+                conversation = Conversation(session_id, slot=self._pick_slot(), context_size=self.context_size)
+                self.conversations[session_id] = conversation
+                while len(self.conversations) > self.max_sessions:
+                    self.conversations.popitem(last=False)
+            self.conversations.move_to_end(session_id)
+            conversation.last_used = time.monotonic()
+            return conversation
+
+    def drop(self, session_id):
+        with self.lock:
+            self.conversations.pop(session_id, None)
+
+    def _pick_slot(self):
+        if not self.slots:
+            return None
+        in_use = {slot: 0 for slot in self.slots}
+        for conversation in self.conversations.values():
+            if conversation.slot in in_use:
+                in_use[conversation.slot] += 1
+        return min(self.slots, key=in_use.get)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for session_id in [s for s, c in self.conversations.items() if now - c.last_used > self.idle_timeout]:
+            del self.conversations[session_id]
+
+    def stats(self):
+        return {"conversations": len(self.conversations)}
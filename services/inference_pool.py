@@ -0,0 +1,96 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+
+class ServerBusy(Exception):
+    """Raised when the admission queue is full"""
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """Dedicated executors per model plus a bounded admission queue
+
+    Blocking model calls (Whisper, llama.cpp HTTP, XTTS, VAD) run on their own
+    thread pool so the event loop keeps serving other requests. The model
+    libraries release the GIL during inference, so threads are enough and the
+    models don't have to be loaded once per process.
+
+    Args:
+        workers: Dict of model name -> pool size, e.g. {"asr": 1, "llm": 4}
+        max_active: Requests processed concurrently
+        max_queued: Requests allowed to wait for a slot; beyond that admit()
+            raises ServerBusy so the caller can answer 503
+    """
+    def __init__(self, workers, max_active=2, max_queued=8):
+        self.executors = {
+            name: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-worker")
+            for name, size in workers.items()
+        }
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.slots = asyncio.Semaphore(max_active)
+        self.admitted = 0
+        self.avg_duration = None
+        self.sizes = dict(workers)
+        self.jobs = {name: 0 for name in workers}   # submitted through run() and not finished
+
+    async def run(self, model, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the executor dedicated to model"""
+        loop = asyncio.get_running_loop()
+        self.jobs[model] += 1
+        try:
+            return await loop.run_in_executor(self.executors[model], partial(fn, *args, **kwargs))
+        finally:
+            self.jobs[model] -= 1
+
+    def retry_after(self):
+        """Seconds a rejected caller should wait, from the average request time"""
+        per_request = self.avg_duration or 5.0
+        waiting = max(self.admitted - self.max_active, 1)
+        return max(1, round(per_request * waiting / self.max_active))
+
+    def saturated(self):
+        """Whether every slot is taken (best-effort work should be skipped)"""
+        return self.admitted >= self.max_active
+
+    @asynccontextmanager
+    async def admit(self):
+        """Hold one of max_active slots, queueing up to max_queued callers"""
+        if self.admitted >= self.max_active + self.max_queued:
+            raise ServerBusy(self.retry_after())
+        self.admitted += 1
+        try:
+            async with self.slots:
+                start = time.perf_counter()
+                yield
+                duration = time.perf_counter() - start
+                # Exponential moving average keeps Retry-After current
+                if self.avg_duration is None:
+                    self.avg_duration = duration
+                else:
+                    self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+        finally:
+            self.admitted -= 1
+
+    def status(self):
+        return {
+            "active": min(self.admitted, self.max_active),
+            "queued": max(self.admitted - self.max_active, 0),
+            "max_active": self.max_active,
+            "max_queued": self.max_queued,
+            "avg_request_seconds": round(self.avg_duration, 2) if self.avg_duration else None,
+            "saturated": self.saturated(),
+            # Jobs running or waiting per executor; beyond "workers" they queue
+            "executors": {
+                name: {"workers": self.sizes[name], "jobs": self.jobs[name]} for name in self.executors
+            },
+        }
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
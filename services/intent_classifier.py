@@ -0,0 +1,233 @@
+import json
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from services.response_cache import normalize_transcript
+
+DEFAULT_INTENTS_FILE = Path(__file__).with_name("faq_intents.json")
+
+
+def normalize_query(text):
+    """normalize_transcript() without zero-width joiners (ASR output may or may not contain them)"""
+    return normalize_transcript(text).replace("\u200c", "").replace("\u200d", "")
+
+
+def char_ngrams(text, sizes=(2, 3, 4)):
+    """Character n-grams; script-agnostic and tolerant of ASR misspellings"""
+    padded = f" {text} "
+    return [padded[i:i + n] for n in sizes for i in range(len(padded) - n + 1)]
+
+
+class TfidfIndex:
+    """Character n-gram TF-IDF over labelled example texts (cosine similarity)"""
+    def __init__(self, texts, labels):
+        docs = [char_ngrams(text) for text in texts]
+        self.vocab = {}
+        for doc in docs:
+            for gram in doc:
+                self.vocab.setdefault(gram, len(self.vocab))
+        df = np.zeros(len(self.vocab), dtype=np.float32)
+        for doc in docs:
+            df[[self.vocab[gram] for gram in set(doc)]] += 1
+        self.idf = np.log((1 + len(docs)) / (1 + df)) + 1
+        self.matrix = np.stack([self._vector(doc) for doc in docs])
+        self.labels = labels
+
+    def _vector(self, grams):
+        counts = np.zeros(len(self.vocab), dtype=np.float32)
+        for gram in grams:
+            index = self.vocab.get(gram)
+            if index is not None:
+                counts[index] += 1
+        vector = np.log1p(counts) * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def scores(self, text):
+        """{label: best similarity to any of its examples}"""
+        similarities = self.matrix @ self._vector(char_ngrams(text))
+        best = {}
+        for label, similarity in zip(self.labels, similarities):
+            best[label] = max(best.get(label, 0.0), float(similarity))
+        return best
+
+
+class Intent:
+    def __init__(self, name, spec, variables):
+        self.name = name
+        self.weak = spec.get("weak", False)
+        keywords = [k for ks in spec.get("keywords", {}).values() for k in ks]
+        self.keywords = [self._pattern(k) for k in keywords]
+        self.exclude = [self._pattern(k) for k in spec.get("exclude", [])]
+        self.examples = [normalize_query(e) for e in spec.get("examples", [])]
+        # Words the intent's examples and keywords account for (see covers())
+        self.vocabulary = {word for text in self.examples + [normalize_query(k) for k in keywords]
+                           for word in text.split()}
+        self.answers = {language: text.format(**variables) for language, text in spec["answers"].items()}
+
+    @staticmethod
+    def _pattern(phrase):
+        # Latin phrases match whole words; Hindi/Telugu ones also match with
+        # suffixes attached (ki, ko, లో, ...)
+        phrase = normalize_query(phrase)
+        end = r"(?!\S)" if phrase.isascii() else ""
+        return re.compile(r"(?<!\S)" + re.escape(phrase) + end)
+
+    def mentioned(self, text):
+        return any(pattern.search(text) for pattern in self.keywords)
+
+    def excluded(self, text):
+        return any(pattern.search(text) for pattern in self.exclude)
+
+    def covers(self, word):
+        """Whether a query word is one of the intent's words (or one of them with a suffix attached)"""
+        return word in self.vocabulary or any(
+            len(known) >= 4 and word.startswith(known) for known in self.vocabulary
+        )
+
+
+class IntentMatch:
+    def __init__(self, intent, language, answer, confidence, reason):
+        self.intent = intent
+        self.language = language
+        self.answer = answer
+        self.confidence = confidence
+        self.reason = reason   # "keyword" or "similarity"
+
+
+class IntentClassifier:
+    """Fast path for common questions, in front of the LLM
+
+    A query is answered from a template when it clearly asks one of the
+    known FAQ intents (helpline number, how to pay, new connection, ...),
+    in milliseconds instead of a full LLM generation. Anything ambiguous
+    returns None and goes to the LLM as before:
+
+    - long queries (they usually carry details the template can't address)
+    - queries containing an intent's exclude words ("status", "paid", ...)
+    - keywords of more than one intent (greeting/thanks give way to the others)
+    - a keyword match whose wording doesn't resemble the intent's examples
+    - words beyond the intent's own examples, keywords and the shared filler
+      words ("my meter is also broken"): the query asks something more,
+      which a template would silently drop
+    - without keywords, a similarity below `threshold` or too close to a
+      second intent
+
+    Similarity is character n-gram TF-IDF against the intent's example
+    queries, which works the same for English, Hindi and Telugu and tolerates
+    ASR spelling noise.
+
+    Rendered answer audio is kept per (intent, language, voice), so each
+    answer is synthesized once per voice (or rendered once per language up
+    front with a fixed agent voice, see answers()).
+
+    Args:
+        intents_file: JSON file with the intents, their keywords, examples
+            and answers (see services/faq_intents.json)
+        threshold: Similarity needed without a keyword match
+        keyword_threshold: Similarity needed with a keyword match
+        margin: Lead over the second best intent needed without a keyword
+        max_words: Longer queries always go to the LLM
+        max_extra_words: Words the intent doesn't account for that a query
+            may still contain (ASR noise); more go to the LLM
+    """
+    def __init__(self, intents_file=DEFAULT_INTENTS_FILE, threshold=0.7, keyword_threshold=0.5, margin=0.15,
+                 max_words=12, max_extra_words=1):
+        with open(intents_file, encoding="utf-8") as f:
+            spec = json.load(f)
+        variables = spec.get("variables", {})
+        self.intents = {name: Intent(name, intent, variables) for name, intent in spec["intents"].items()}
+        self.filler = {word for phrase in spec.get("filler", []) for word in normalize_query(phrase).split()}
+        self.threshold = threshold
+        self.keyword_threshold = keyword_threshold
+        self.margin = margin
+        self.max_words = max_words
+        self.max_extra_words = max_extra_words
+
+        texts, labels = [], []
+        for intent in self.intents.values():
+            texts += intent.examples
+            labels += [intent.name] * len(intent.examples)
+        self.index = TfidfIndex(texts, labels)
+
+        self.audio = {}   # (intent, language, voice) -> rendered audio
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        print(f"✅ Intent classifier ready ({len(self.intents)} intents, {len(texts)} examples)")
+
+    def classify(self, text):
+        """(intent name, confidence, reason), or None when the query is ambiguous"""
+        text = normalize_query(text)
+        if not text or len(text.split()) > self.max_words:
+            return None
+
+        mentioned = [intent for intent in self.intents.values() if intent.mentioned(text)]
+        if len(mentioned) > 1:
+            mentioned = [intent for intent in mentioned if not intent.weak]
+        if len(mentioned) > 1:
+            return None
+
+        scores = self.index.scores(text)
+        if mentioned:
+            intent = mentioned[0]
+            if (intent.excluded(text) or scores.get(intent.name, 0.0) < self.keyword_threshold
+                    or len(self.extra_words(intent, text)) > self.max_extra_words):
+                return None
+            return intent.name, scores[intent.name], "keyword"
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        name, best = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        intent = self.intents[name]
+        if (best < self.threshold or best - second < self.margin or intent.excluded(text)
+                or len(self.extra_words(intent, text)) > self.max_extra_words):
+            return None
+        return name, best, "similarity"
+
+    def extra_words(self, intent, text):
+        """Words of a normalized query that neither the intent nor the filler list accounts for"""
+        return [word for word in text.split()
+                if len(word) > 1 and word not in self.filler and not intent.covers(word)]
+
+    def match(self, text, language="en"):
+        """IntentMatch with the templated answer in the caller's language, or None"""
+        result = self.classify(text)
+        with self.lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        name, confidence, reason = result
+        answers = self.intents[name].answers
+        language = language if language in answers else "en"
+        print(f"🎯 Intent '{name}' ({reason}, {confidence:.2f}): answering from template")
+        return IntentMatch(name, language, answers[language], confidence, reason)
+
+    def get_audio(self, match, voice=None):
+        with self.lock:
+            return self.audio.get((match.intent, match.language, voice))
+
+    def set_audio(self, match, voice, audio):
+        with self.lock:
+            self.audio[(match.intent, match.language, voice)] = audio
+
+    def forget_audio(self, audio):
+        """Drop references to rendered audio that no longer exists"""
+        with self.lock:
+            for key in [key for key, value in self.audio.items() if value == audio]:
+                del self.audio[key]
+
+    def answers(self, languages=("en", "hi", "te")):
+        """IntentMatch for every answer in the given languages (e.g. to render them ahead of time)"""
+        for name, intent in self.intents.items():
+            for language in languages:
+                if language in intent.answers:
+                    yield IntentMatch(name, language, intent.answers[language], 1.0, "template")
+
+    def stats(self):
+        return {"intents": len(self.intents), "hits": self.hits, "misses": self.misses,
+                "rendered": len(self.audio)}
@@ -0,0 +1,183 @@
+import socket
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+
+class Backend:
+    """One llama-server replica"""
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0       # requests in flight from this process
+        self.idle_slots = None     # idle server slots at the last probe, if the server reports them
+        self.has_slots = True      # False once /slots turned out to be disabled
+        self.requests = 0
+        self.errors = 0
+        self.last_error = None
+
+
+class BackendPool:
+    """llama-server replicas, routed by least outstanding requests
+
+    Each request goes to the healthy replica with the fewest requests in
+    flight from this process; ties go to the one with more idle slots (as
+    last probed), then to the one that has served fewer requests. A replica
+    that fails is ejected until a health probe finds it up again. If every
+    replica is ejected, requests still go to one of them rather than failing
+    outright.
+
+    Args:
+        urls: llama-server base URLs
+        discover: Resolve each URL's host name to all of its IPv4 addresses
+            and use every address as a replica. Docker's DNS answers with
+            one address per container of a service, so replicas added or
+            removed with `docker compose --scale` are picked up on the next
+            probe round.
+        probe_interval: Seconds between health probes (0 = never probe)
+        probe_timeout: Seconds to wait for a probe answer
+    """
+    def __init__(self, urls, discover=False, probe_interval=5.0, probe_timeout=2.0):
+        self.urls = [url.rstrip("/") for url in urls]
+        self.discover = discover
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.backends = {url: Backend(url) for url in self.urls}
+        self.resolved = {url: [url] for url in self.urls}   # source URL -> replica URLs
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self._stop = threading.Event()
+        self._thread = None
+
+        if discover:
+            self._resolve()
+        # A single fixed server has nowhere to fail over to, so it isn't probed
+        if probe_interval and (discover or len(self.backends) > 1):
+            self._thread = threading.Thread(target=self._probe_loop, daemon=True)
+            self._thread.start()
+
+    def _resolve(self):
+        """Expand the host names into one backend per address"""
+        for url in self.urls:
+            parts = urlsplit(url)
+            try:
+                infos = socket.getaddrinfo(parts.hostname, parts.port, socket.AF_INET, socket.SOCK_STREAM)
+            except socket.gaierror:
+                continue   # not resolvable right now: keep the replicas found before
+            self.resolved[url] = [
+                urlunsplit(parts._replace(netloc=f"{address}:{parts.port}" if parts.port else address))
+                for address in sorted({info[4][0] for info in infos})
+            ]
+        urls = [replica for url in self.urls for replica in self.resolved[url]]
+
+        with self.lock:
+            for url in urls:
+                if url not in self.backends:
+                    self.backends[url] = Backend(url)
+                    print(f"➕ LLM backend {url}")
+            for url in [u for u in self.backends if u not in urls]:
+                # In-flight requests keep their Backend object; it just stops being picked
+                del self.backends[url]
+                print(f"➖ LLM backend {url}")
+
+    def pick(self, exclude=(), prefer=None):
+        """Backend for the next attempt of a request
+
+        Args:
+            exclude: URLs this request already failed on
+            prefer: URL to use if it is healthy (e.g. the replica holding a
+                conversation's cached history)
+        """
+        with self.lock:
+            candidates = [b for b in self.backends.values() if b.url not in exclude] or list(self.backends.values())
+            healthy = [b for b in candidates if b.healthy]
+            for backend in healthy:
+                if backend.url == prefer:
+                    return backend
+            return min(healthy or candidates,
+                       key=lambda b: (b.outstanding, -(b.idle_slots or 0), b.requests))
+
+    @contextmanager
+    def use(self, backend):
+        """Count a request as outstanding on the backend while it runs"""
+        with self.lock:
+            backend.outstanding += 1
+            backend.requests += 1
+        try:
+            yield backend
+        finally:
+            with self.lock:
+                backend.outstanding -= 1
+
+    def mark_ok(self, backend):
+        with self.lock:
+            if not backend.healthy:
+                print(f"✅ LLM backend {backend.url} is back")
+            backend.healthy = True
+
+    def mark_failed(self, backend, error):
+        with self.lock:
+            backend.errors += 1
+            backend.last_error = str(error)
+            if backend.healthy:
+                print(f"⚠️ Ejecting LLM backend {backend.url}: {error}")
+            backend.healthy = False
+
+    def probe(self, backend):
+        """Check /health (and /slots for idle slots); returns whether the backend is up"""
+        try:
+            # 503 while the model is still loading
+            response = self.session.get(f"{backend.url}/health", timeout=self.probe_timeout)
+            if response.status_code != 200:
+                self.mark_failed(backend, f"/health returned {response.status_code}")
+                return False
+            # Older servers report idle slots in /health; newer ones in /slots (unless --no-slots)
+            idle = response.json().get("slots_idle")
+            if idle is None and backend.has_slots:
+                response = self.session.get(f"{backend.url}/slots", timeout=self.probe_timeout)
+                if response.status_code == 200:
+                    idle = sum(1 for slot in response.json()
+                               if not slot.get("is_processing", slot.get("state", 0) != 0))
+                else:
+                    backend.has_slots = False
+        except requests.RequestException as e:
+            self.mark_failed(backend, e)
+            return False
+        except ValueError:
+            idle = None
+        backend.idle_slots = idle
+        self.mark_ok(backend)
+        return True
+
+    def probe_all(self):
+        if self.discover:
+            self._resolve()
+        for backend in self.all():
+            self.probe(backend)
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            self.probe_all()
+
+    def all(self):
+        with self.lock:
+            return list(self.backends.values())
+
+    def status(self):
+        return {
+            backend.url: {
+                "healthy": backend.healthy,
+                "outstanding": backend.outstanding,
+                "idle_slots": backend.idle_slots,
+                "requests": backend.requests,
+                "errors": backend.errors,
+                "last_error": backend.last_error,
+            }
+            for backend in self.all()
+        }
+
+    def close(self):
+        self._stop.set()
+        self.session.close()
@@ -1,23 +1,234 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
 from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
 
-class LLMService:
-    def __init__(self, model_path="models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf"):
-        print("Loading Llama model...")
+from services.sentences import stream_sentences
+
+SPECULATIVE_MODES = ("prompt-lookup", "draft-model")
+
+class DraftModel(LlamaDraftModel):
+    """Drafts tokens greedily with a small GGUF model
+    
+    The draft model must share the main model's vocabulary (e.g. Llama 3.2
+    1B Instruct for Llama 3.1 8B Instruct). Its own KV cache keeps the
+    matching prefix between calls, so each call only evaluates the tokens
+    accepted since the last one.
+    """
+    def __init__(self, model_path, num_pred_tokens=4, n_ctx=1024, n_threads=1):
         self.llm = Llama(
             model_path=model_path,
-            n_ctx=1024,
-            n_threads=4
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            use_mmap=True,
+            verbose=False
         )
-        print("✅ Llama model loaded")
+        self.num_pred_tokens = num_pred_tokens
     
-    def generate_response(self, user_input, language="en", max_tokens=256):
-        """Generate response using Llama in the detected language
-        
+    def __call__(self, input_ids, /, **kwargs):
+        draft = []
+        for token in self.llm.generate(input_ids.tolist(), top_k=1, temp=0.0):
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return np.array(draft, dtype=np.intc)
+
+class CountingDraft(LlamaDraftModel):
+    """Wraps a draft model and counts the tokens it proposes"""
+    def __init__(self, draft):
+        self.draft = draft
+        self.calls = 0
+        self.proposed = 0
+    
+    def __call__(self, input_ids, /, **kwargs):
+        tokens = self.draft(input_ids, **kwargs)
+        self.calls += 1
+        self.proposed += len(tokens)
+        return tokens
+
+class GenerationStats:
+    """Decode rate and draft acceptance of one generation on one instance
+    
+    llama-cpp-python doesn't report acceptance. It calls the draft model once
+    per verification step (after the first), and every step yields its
+    accepted draft tokens plus one sampled token, so accepted drafts are
+    about generated tokens - draft calls - 1.
+    """
+    def __init__(self, instance):
+        self.draft = instance.draft
+        self.start = time.perf_counter()
+        self.calls = self.draft.calls if self.draft else 0
+        self.proposed = self.draft.proposed if self.draft else 0
+        self.tokens = 0
+        self.seconds = 0.0
+    
+    def finish(self, tokens):
+        self.tokens = tokens
+        self.seconds = time.perf_counter() - self.start
+        if self.draft:
+            self.calls = self.draft.calls - self.calls
+            self.proposed = self.draft.proposed - self.proposed
+        self.accepted = min(max(tokens - self.calls - 1, 0), self.proposed)
+    
+    def report(self):
+        line = f"✅ Generated {self.tokens} tokens in {self.seconds:.2f}s ({self.tokens / max(self.seconds, 1e-6):.1f} tok/s"
+        if self.draft:
+            line += f", {self.accepted}/{self.proposed} drafted tokens accepted"
+        print(line + ")")
+
+class LlamaInstance:
+    """One llama.cpp context: its own KV cache and per-language system prompt states"""
+    def __init__(self, model_path, n_ctx, n_threads, n_batch, draft=None):
+        self.draft = CountingDraft(draft) if draft is not None else None
+        # Weights are mmap'd, so every instance in the process shares one copy
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            n_batch=n_batch,
+            use_mmap=True,
+            draft_model=self.draft,
+            verbose=False
+        )
+        # Per-language (prefix tokens, saved KV state) for the system prompt
+        self.prefix_cache = {}
+
+class LLMService:
+    """In-process Llama backend
+    
+    Requests are scheduled over a pool of Llama instances. Each instance has
+    its own context (KV cache) but they share the mmap'd weights, so extra
+    instances cost only their KV cache. A request waits in a FIFO queue for
+    a free instance and holds it until its generation finishes, so concurrent
+    callers run side by side instead of corrupting one shared context. Token
+    generation on CPU is memory-bandwidth bound, so several instances with a
+    few threads each get more total tokens/s than one instance with all
+    cores. Keep instances * n_threads at or below the number of physical cores.
+    
+    With `speculative` set, a cheap drafter proposes the next few tokens and
+    the model verifies them all in one batched forward pass, so every accepted
+    draft token saves a full decode step. "prompt-lookup" drafts by finding
+    the last n-gram earlier in the prompt and copying what followed it, which
+    works well here because answers repeat phrasing from the system prompt
+    and the query. "draft-model" drafts with a small GGUF model instead.
+    Output is unchanged, but verification needs logits for every position
+    (see the memory note on `speculative` below).
+    """
+    def __init__(self, model_path="models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf", warm_languages=("en",),
+                 instances=1, n_threads=4, n_ctx=1024, n_batch=512,
+                 speculative=None, draft_tokens=2, draft_model_path=None, draft_threads=1, prefix_snapshots=True):
+        """
         Args:
-            user_input: User's question/input
-            language: Language code (en/hi/te)
-            max_tokens: Maximum response length (default 512, ~300-400 words)
+            model_path: GGUF model file
+            warm_languages: Languages whose system prompt is prefilled and
+                cached at startup (others are cached on first use)
+            instances: Llama contexts serving requests concurrently
+            n_threads: Threads per instance
+            n_ctx: Context length per instance
+            n_batch: Prompt tokens evaluated per batch during prefill
+            speculative: None, "prompt-lookup" or "draft-model". Memory: the
+                logits buffer grows from n_batch to n_ctx rows of n_vocab
+                floats per instance (Llama 3: ~0.5 GB at n_ctx=1024, ~2 GB at
+                4096). A save_state() snapshot would copy that buffer, so the
+                per-language prefix snapshots are not kept in this mode. Only
+                the first warm language is prefilled, and a prompt is
+                prefilled again after a language switch.
+            draft_tokens: Tokens drafted per step (2-4 suits CPUs; ~10 suits GPUs)
+            draft_model_path: Small GGUF model with the same vocabulary ("draft-model" only)
+            draft_threads: Threads for each instance's draft model ("draft-model" only)
+            prefix_snapshots: Keep a save_state() snapshot of each language's
+                prefilled system prompt, so a language switch restores it
+                instead of prefilling again. Each snapshot copies the logits
+                buffer (n_batch rows of n_vocab floats: ~262 MB for Llama 3 at
+                n_batch=512) plus the prompt's KV cache, per language and
+                instance (~0.8 GB for 3 warm languages on one instance). Set
+                False to keep none; only the first warm language is then
+                prefilled. Always off with `speculative`.
         """
+        if speculative not in (None,) + SPECULATIVE_MODES:
+            raise ValueError(f"Unknown speculative mode '{speculative}' (choose from {', '.join(SPECULATIVE_MODES)})")
+        if speculative == "draft-model" and not draft_model_path:
+            raise ValueError("speculative='draft-model' needs draft_model_path")
+        self.speculative = speculative
+        # With speculative decoding a snapshot would copy the n_ctx-row logits buffer
+        self.snapshot_prefixes = prefix_snapshots and speculative is None
+        if not self.snapshot_prefixes:
+            warm_languages = tuple(warm_languages)[:1]
+        
+        def draft():
+            if speculative == "prompt-lookup":
+                return LlamaPromptLookupDecoding(num_pred_tokens=draft_tokens)
+            if speculative == "draft-model":
+                return DraftModel(draft_model_path, num_pred_tokens=draft_tokens, n_ctx=n_ctx, n_threads=draft_threads)
+            return None
+        
+        print(f"Loading Llama model ({instances} instance(s), {n_threads} thread(s) each, n_ctx={n_ctx}"
+              + (f", speculative={speculative} x{draft_tokens})..." if speculative else ")..."))
+        self.instances = [LlamaInstance(model_path, n_ctx, n_threads, n_batch, draft()) for _ in range(instances)]
+        print("✅ Llama model loaded")
+        
+        self.idle = queue.Queue()
+        for instance in self.instances:
+            self.idle.put(instance)
+        self.waiting = 0
+        self.lock = threading.Lock()
+        # Totals over all generations, for status()
+        self.totals = {"generations": 0, "tokens": 0, "seconds": 0.0, "proposed": 0, "accepted": 0}
+        
+        for instance in self.instances:
+            for language in warm_languages:
+                self._load_prefix(instance, language)
+    
+    @contextmanager
+    def _instance(self):
+        """Wait (in arrival order) for a free instance and hold it"""
+        with self.lock:
+            self.waiting += 1
+        try:
+            instance = self.idle.get()
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        try:
+            yield instance
+        finally:
+            self.idle.put(instance)
+    
+    def status(self):
+        return {
+            "instances": len(self.instances),
+            "busy": len(self.instances) - self.idle.qsize(),
+            "waiting": self.waiting,
+            "speculative": self.speculative,
+            **self.speed(),
+        }
+    
+    def speed(self):
+        """Average decode rate and draft acceptance over all generations so far"""
+        with self.lock:
+            totals = dict(self.totals)
+        return {
+            "generations": totals["generations"],
+            "tok_s": round(totals["tokens"] / totals["seconds"], 2) if totals["seconds"] else None,
+            "draft_acceptance": round(totals["accepted"] / totals["proposed"], 3) if totals["proposed"] else None,
+        }
+    
+    def _finish(self, stats, tokens):
+        stats.finish(tokens)
+        stats.report()
+        with self.lock:
+            self.totals["generations"] += 1
+            self.totals["tokens"] += stats.tokens
+            self.totals["seconds"] += stats.seconds
+            self.totals["proposed"] += stats.proposed
+            self.totals["accepted"] += stats.accepted
+    
+    def _system_prompt(self, language):
+        """System message for the given language"""
         # Universal instruction for all languages
         universal_instruction = (
             "You are an intelligent multilingual voice assistant designed to handle customer queries "
@@ -61,20 +272,112 @@ class LLMService:
         
         # Combine universal instruction with language-specific instruction
         lang_specific = lang_instructions.get(language, lang_instructions["en"])
-        system_msg = f"{universal_instruction}\n\n{lang_specific}"
+        return f"{universal_instruction}\n\n{lang_specific}"
+    
+    def _load_prefix(self, instance, language):
+        """Put the KV state for this language's system prompt into an instance
+        
+        The system prompt is prefilled once per language and instance and
+        saved with save_state(). When a different language was used last, the
+        saved state is restored instead of re-evaluating the prompt. Without
+        snapshots (prefix_snapshots=False or speculative mode) only the KV cache's current prefix is
+        reused, and another language's prompt is prefilled by the next
+        generation. Returns the prefix tokens.
+        """
+        llm = instance.llm
+        if language not in instance.prefix_cache:
+            prefix = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+{self._system_prompt(language)}<|eot_id|>
+"""
+            tokens = llm.tokenize(prefix.encode("utf-8"), add_bos=False, special=True)
+            start = time.perf_counter()
+            llm.reset()
+            llm.eval(tokens)
+            instance.prefix_cache[language] = (tokens, llm.save_state() if self.snapshot_prefixes else None)
+            print(f"✅ Cached {language} system prompt ({len(tokens)} tokens, {time.perf_counter() - start:.1f}s)")
+            return tokens
+        
+        tokens, state = instance.prefix_cache[language]
+        n = len(tokens)
+        if state is not None and (llm.n_tokens < n or list(llm._input_ids[:n]) != tokens):
+            llm.load_state(state)
+        return tokens
+    
+    def _prompt_tokens(self, instance, user_input, language):
+        """System prompt prefix (from the cache) + the user turn"""
+        if language not in ("en", "hi", "te"):
+            language = "en"
+        prefix_tokens = self._load_prefix(instance, language)
         
-        prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
-{system_msg}<|eot_id|>
-<|start_header_id|>user<|end_header_id|>
+        turn = f"""<|start_header_id|>user<|end_header_id|>
 {user_input}<|eot_id|>
 <|start_header_id|>assistant<|end_header_id|>
 """
+        return prefix_tokens + instance.llm.tokenize(turn.encode("utf-8"), add_bos=False, special=True)
+    
+    def warmup(self):
+        """One short generation per instance so the first real requests run at full speed"""
+        for instance in self.instances:
+            prompt_tokens = self._prompt_tokens(instance, "Hello", "en")
+            instance.llm(prompt_tokens, max_tokens=1)
+    
+    def generate_response(self, user_input, language="en", max_tokens=256, temperature=0.6):
+        """Generate response using Llama in the detected language
         
-        response = self.llm(
-            prompt,
-            max_tokens=max_tokens,
-            temperature=0.6,
-            stop=["<|eot_id|>"]
-        )
+        Only the user turn is prefilled: the system prompt's KV state comes
+        from the per-language prefix cache, and llama.cpp reuses the matching
+        prefix of the evaluated tokens.
+        
+        Args:
+            user_input: User's question/input
+            language: Language code (en/hi/te)
+            max_tokens: Maximum response length (default 512, ~300-400 words)
+            temperature: Sampling temperature (0 = greedy)
+        """
+        with self._instance() as instance:
+            stats = GenerationStats(instance)
+            response = instance.llm(
+                self._prompt_tokens(instance, user_input, language),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=["<|eot_id|>"]
+            )
+            self._finish(stats, response["usage"]["completion_tokens"])
         
         return response["choices"][0]["text"].strip()
+    
+    def generate_stream(self, user_input, language="en", max_tokens=256, by_sentence=False, temperature=0.6):
+        """Stream the response as it is generated
+        
+        The request holds its instance until the stream is exhausted or closed.
+        
+        Args:
+            user_input: User's question/input
+            language: Language code (en/hi/te)
+            max_tokens: Maximum response length
+            by_sentence: Group tokens into whole sentences before yielding
+            temperature: Sampling temperature (0 = greedy)
+        """
+        tokens = self._stream_tokens(user_input, language, max_tokens, temperature)
+        return stream_sentences(tokens) if by_sentence else tokens
+    
+    def _stream_tokens(self, user_input, language, max_tokens, temperature):
+        with self._instance() as instance:
+            stats = GenerationStats(instance)
+            pieces = []
+            try:
+                for chunk in instance.llm(
+                    self._prompt_tokens(instance, user_input, language),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stop=["<|eot_id|>"],
+                    stream=True
+                ):
+                    text = chunk["choices"][0]["text"]
+                    if text:
+                        pieces.append(text)
+                        yield text
+            finally:
+                # Stream chunks can merge tokens; count the generated text's tokens instead
+                text = "".join(pieces).encode("utf-8")
+                self._finish(stats, len(instance.llm.tokenize(text, add_bos=False)) if text else 0)
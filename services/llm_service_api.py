@@ -1,56 +1,500 @@
+import asyncio
 import requests
 import json
+import time
+from contextlib import asynccontextmanager, contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from services.llm_backends import BackendPool
+from services.sentences import stream_sentences, astream_sentences
+
+# Optional httpx import for the asyncio client
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+CONNECT_ERROR = "Error: Cannot connect to llama.cpp server. Make sure it's running on port 8080."
+
+
+class LLMError(RuntimeError):
+    """A streamed generation failed (the message is the same "Error: ..." text generate_response returns)"""
+
+
+def _not_sent(error):
+    """Whether a requests ConnectionError happened before the request reached the server"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    # NewConnectionError (refused, unreachable, DNS) subclasses ConnectTimeoutError
+    return isinstance(reason, ConnectTimeoutError)
+
 
 class LLMService:
-    """LLM Service using llama.cpp server API"""
-    def __init__(self, base_url="http://localhost:8080"):
-        self.base_url = base_url
-        print(f"Using llama.cpp server at {base_url}")
-        print("✅ LLM service configured (make sure llama.cpp server is running)")
+    """LLM Service using llama.cpp server API
     
-    def generate_response(self, user_input, language="en", max_tokens=512):
-        """Generate response using llama.cpp server
-        
+    Requests go through a persistent keep-alive connection pool. With several
+    servers, each request goes to the one with the fewest requests in flight
+    (see BackendPool); a server that fails is ejected until a health probe
+    finds it up again. Errors before the request was sent (server not up,
+    connection refused) are retried, on another server when there is one.
+    Errors after the prompt was sent are not, so a generation is never
+    submitted twice.
+    """
+    def __init__(self, base_url="http://localhost:8080", pool_size=8, retries=2,
+                 connect_timeout=3.0, timeout=300, prompt_slots=None, backends=None, discover=False,
+                 probe_interval=5.0):
+        """
         Args:
-            user_input: User's question/input
-            language: Language code (en/hi/te)
-            max_tokens: Maximum response length (default 512, ~300-400 words)
+            base_url: llama.cpp server URL
+            pool_size: Keep-alive connections kept open per server
+            retries: Retries on connection errors
+            connect_timeout: Seconds to wait for a TCP connection
+            timeout: Default per-request deadline in seconds (5 minutes for slower CPUs)
+            prompt_slots: Optional {language: slot id} to pin each language's
+                system prompt to a server slot (start llama-server with
+                -np >= the number of slots). Requests then always land on
+                the slot that already holds their system prompt in its KV cache.
+            backends: List of llama.cpp server URLs to spread requests over
+                (replaces base_url). Start every server with the same -np.
+            discover: Use every address a backend's host name resolves to as
+                a separate server (for `docker compose --scale`)
+            probe_interval: Seconds between health probes of the servers
         """
+        self.base_url = base_url
+        self.retries = retries
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.prompt_slots = prompt_slots or {}
+        self.backends = BackendPool(backends or [base_url], discover=discover, probe_interval=probe_interval)
+        
+        # Connection retries happen in _send, so they can move to another server
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(self.backends.all()), 8), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # Created lazily on first use, inside the caller's event loop
+        self.pool_size = pool_size
+        self._async_client = None
+        
+        print(f"Using llama.cpp server(s) at {', '.join(b.url for b in self.backends.all())}")
+        print("✅ LLM service configured (make sure llama.cpp server is running)")
+
+    def warmup(self):
+        """One short generation per server: opens pooled connections and primes the prompt caches"""
+        payload = self._payload(self._build_prompt("Hello"), 1)
+        errors = []
+        for backend in self.backends.all():
+            try:
+                response = self.session.post(f"{backend.url}/completion", json=payload,
+                                             timeout=(self.connect_timeout, self.timeout))
+                if response.status_code != 200:
+                    errors.append(f"{backend.url} returned {response.status_code}")
+            except requests.exceptions.RequestException as e:
+                self.backends.mark_failed(backend, e)
+                errors.append(f"{backend.url}: {e}")
+        if len(errors) == len(self.backends.all()):
+            raise RuntimeError(f"Error: no llama.cpp server answered ({'; '.join(errors)})")
+        for error in errors:
+            print(f"⚠️ Warm-up failed on {error}")
+
+    def status(self):
+        """Per-server health and load"""
+        return self.backends.status()
+    
+    def _build_prompt(self, user_input, language="en", history=()):
+        """Build the Llama 3 chat prompt for the given language, replaying earlier turns"""
         lang_instructions = {
             "en": "You are a helpful voice assistant. Give clear, natural responses in English. Be informative but conversational. You can use English words naturally when needed.",
             "hi": "आप एक सहायक वॉयस असिस्टेंट हैं। हिंदी में स्पष्ट, स्वाभाविक उत्तर दें। जानकारीपूर्ण लेकिन बातचीत के अंदाज में जवाब दें। अगर जरूरी हो तो English शब्द भी इस्तेमाल कर सकते हैं।",
             "te": "మీరు సహాయక వాయిస్ అసిస్టెంట్. తెలుగులో స్పష్టమైన, సహజ ప్రతిస్పందనలు ఇవ్వండి. సమాచారంతో కూడిన కానీ సంభాషణ శైలిలో సమాధానం ఇవ్వండి. అవసరమైతే English పదాలు కూడా వాడవచ్చు।"
         }
-        
+
         system_msg = lang_instructions.get(language, lang_instructions["en"])
-        
-        prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+        turns = "".join(
+            f"""<|start_header_id|>user<|end_header_id|>
+{user}<|eot_id|>
+<|start_header_id|>assistant<|end_header_id|>
+{assistant}<|eot_id|>
+"""
+            for user, assistant in history
+        )
+
+        return f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
 {system_msg}<|eot_id|>
-<|start_header_id|>user<|end_header_id|>
+{turns}<|start_header_id|>user<|end_header_id|>
 {user_input}<|eot_id|>
 <|start_header_id|>assistant<|end_header_id|>
 """
-        
+
+    def _prepare(self, user_input, language, max_tokens, conversation):
+        """(prompt, slot) for a request, with the conversation's history if any"""
+        if conversation is None:
+            return self._build_prompt(user_input, language), None
+        history = conversation.history(user_input, max_tokens)
+        return self._build_prompt(user_input, language, history), conversation.slot
+
+    def _record(self, conversation, user_input, text, result=None):
+        """Add a finished (or interrupted) turn to the conversation
+
+        Only called for generations that succeeded, so the text is never
+        inspected for errors (an answer may well mention "Error:" codes).
+        """
+        text = text.strip()
+        if conversation is None or not text:
+            return
+        result = result or {}
+        conversation.add_turn(user_input, text, result.get("tokens_evaluated"), result.get("tokens_predicted"))
+
+    def _payload(self, prompt, max_tokens, language="en", stream=False, slot=None):
+        payload = {
+            "prompt": prompt,
+            "n_predict": max_tokens,  # Configurable token limit
+            "temperature": 0.7,
+            "stop": ["<|eot_id|>"],
+            "n_threads": 4,  # Use 4 CPU threads for faster processing
+            # Reuse the KV cache for the prompt prefix the slot already holds,
+            # so only the user turn is prefilled
+            "cache_prompt": True
+        }
+        if slot is None:
+            slot = self.prompt_slots.get(language)
+        if slot is not None:
+            payload["id_slot"] = slot
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    @contextmanager
+    def _send(self, payload, timeout, conversation=None, stream=False):
+        """POST /completion, failing over to another server while nothing was sent
+
+        A conversation goes back to the server that holds its history in the
+        KV cache; if that one is down, another server takes over (and
+        prefills the history once).
+        """
+        tried = []
+        for attempt in range(self.retries + 1):
+            backend = self.backends.pick(exclude=tried, prefer=conversation.backend if conversation else None)
+            if backend.url in tried:
+                time.sleep(0.5 * 2 ** (attempt - 1))   # nowhere else to go: back off
+            tried.append(backend.url)
+            with self.backends.use(backend):
+                try:
+                    response = self.session.post(f"{backend.url}/completion", json=payload, stream=stream,
+                                                 timeout=timeout)
+                except requests.exceptions.ConnectionError as e:
+                    self.backends.mark_failed(backend, e)
+                    if attempt < self.retries and _not_sent(e):
+                        continue
+                    raise
+                if response.status_code == 503 and attempt < self.retries:
+                    # Still loading the model: nothing was generated, try elsewhere
+                    response.close()
+                    self.backends.mark_failed(backend, "server returned 503")
+                    continue
+                if response.status_code == 200:
+                    self.backends.mark_ok(backend)
+                    if conversation is not None:
+                        conversation.backend = backend.url
+                try:
+                    with response:
+                        yield response
+                except requests.exceptions.ConnectionError as e:
+                    # Dropped mid-generation: eject, but don't resubmit
+                    self.backends.mark_failed(backend, e)
+                    raise
+                return
+
+    def generate_response(self, user_input, language="en", max_tokens=512, deadline=None, conversation=None):
+        """Generate response using llama.cpp server
+
+        Args:
+            user_input: User's question/input
+            language: Language code (en/hi/te)
+            max_tokens: Maximum response length (default 512, ~300-400 words)
+            deadline: Seconds before giving up (default: the service timeout)
+            conversation: Optional Conversation; earlier turns are replayed on
+                its slot and this turn is added to it
+        """
+        prompt, slot = self._prepare(user_input, language, max_tokens, conversation)
+
         try:
-            response = requests.post(
-                f"{self.base_url}/completion",
-                json={
-                    "prompt": prompt,
-                    "n_predict": max_tokens,  # Configurable token limit
-                    "temperature": 0.7,
-                    "stop": ["<|eot_id|>"],
-                    "n_threads": 4  # Use 4 CPU threads for faster processing
-                },
-                timeout=300  # Increased to 5 minutes for slower CPUs
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["content"].strip()
-            else:
-                return f"Error: Server returned {response.status_code}"
-                
+            with self._send(
+                self._payload(prompt, max_tokens, language, slot=slot),
+                (self.connect_timeout, deadline or self.timeout),
+                conversation
+            ) as response:
+                if response.status_code == 200:
+                    result = response.json()
+                    self._record(conversation, user_input, result["content"], result)
+                    return result["content"].strip()
+                else:
+                    return f"Error: Server returned {response.status_code}"
+
         except requests.exceptions.ConnectionError:
-            return "Error: Cannot connect to llama.cpp server. Make sure it's running on port 8080."
+            return CONNECT_ERROR
+        except requests.exceptions.Timeout:
+            return "Error: llama.cpp server timed out"
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    def generate_stream(self, user_input, language="en", max_tokens=512, by_sentence=False, deadline=None,
+                        conversation=None):
+        """Stream the response from llama.cpp server as it is generated
+
+        Yields tokens as the server's SSE events arrive (or complete sentences
+        when by_sentence=True) so callers can start TTS before the answer is done.
+        Errors raise LLMError (after any tokens already yielded), so error
+        text never reaches TTS or the caller's transcript.
+
+        Args:
+            user_input: User's question/input
+            language: Language code (en/hi/te)
+            max_tokens: Maximum response length
+            by_sentence: Group tokens into whole sentences before yielding
+            deadline: Seconds for the whole generation (default: the service timeout)
+            conversation: Optional Conversation (see generate_response). A
+                stream closed early records the part generated so far.
+        """
+        tokens = self._stream_tokens(user_input, language, max_tokens, deadline or self.timeout, conversation)
+        if by_sentence:
+            return stream_sentences(tokens)
+        return tokens
+
+    def _stream_tokens(self, user_input, language, max_tokens, deadline, conversation=None):
+        """Yield raw tokens from the server's /completion SSE stream"""
+        prompt, slot = self._prepare(user_input, language, max_tokens, conversation)
+        stats = StreamStats()
+        parts = []
+        last_event = None
+        failed = False
+
+        try:
+            with self._send(
+                self._payload(prompt, max_tokens, language, stream=True, slot=slot),
+                (self.connect_timeout, deadline),
+                conversation,
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    failed = True
+                    raise LLMError(f"Error: Server returned {response.status_code}")
+
+                for line in response.iter_lines(decode_unicode=True):
+                    event = parse_sse_line(line)
+                    if event is None:
+                        continue
+                    last_event = event
+                    token = event.get("content", "")
+                    if token:
+                        stats.token()
+                        parts.append(token)
+                        yield token
+                    if event.get("stop"):
+                        break
+                    if stats.elapsed() > deadline:
+                        failed = True
+                        raise LLMError("Error: llama.cpp server exceeded the deadline")
+
+        except requests.exceptions.ConnectionError:
+            failed = True
+            raise LLMError(CONNECT_ERROR)
+        except requests.exceptions.Timeout:
+            failed = True
+            raise LLMError("Error: llama.cpp server timed out")
+        except LLMError:
+            failed = True
+            raise
+        except Exception as e:
+            failed = True
+            raise LLMError(f"Error: {str(e)}") from e
+        finally:
+            # Also runs when the caller closes the stream early (barge-in)
+            if not failed:
+                self._record(conversation, user_input, "".join(parts), last_event)
+
+        stats.report()
+
+    @staticmethod
+    def _require_httpx():
+        """Fail clearly (before any httpx name is touched) when httpx isn't installed"""
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("httpx is required for the async LLM client (pip install httpx)")
+
+    def _client(self):
+        """Shared httpx.AsyncClient with keep-alive pooling and connect retries"""
+        self._require_httpx()
+        if self._async_client is None:
+            # Limits are per client, so size them for every server
+            size = self.pool_size * len(self.backends.all())
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=size, max_keepalive_connections=size)
+            )
+        return self._async_client
+
+    @asynccontextmanager
+    async def _asend(self, payload, timeout, conversation=None, stream=False):
+        """Async version of _send"""
+        client = self._client()
+        tried = []
+        for attempt in range(self.retries + 1):
+            backend = self.backends.pick(exclude=tried, prefer=conversation.backend if conversation else None)
+            if backend.url in tried:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+            tried.append(backend.url)
+            with self.backends.use(backend):
+                request = client.build_request("POST", f"{backend.url}/completion", json=payload, timeout=timeout)
+                try:
+                    response = await client.send(request, stream=stream)
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    self.backends.mark_failed(backend, e)
+                    if attempt < self.retries:
+                        continue
+                    raise
+                except (httpx.NetworkError, httpx.RemoteProtocolError) as e:
+                    self.backends.mark_failed(backend, e)
+                    raise
+                if response.status_code == 503 and attempt < self.retries:
+                    await response.aclose()
+                    self.backends.mark_failed(backend, "server returned 503")
+                    continue
+                if response.status_code == 200:
+                    self.backends.mark_ok(backend)
+                    if conversation is not None:
+                        conversation.backend = backend.url
+                try:
+                    yield response
+                except (httpx.NetworkError, httpx.RemoteProtocolError) as e:
+                    self.backends.mark_failed(backend, e)
+                    raise
+                finally:
+                    await response.aclose()
+                return
+
+    async def agenerate_response(self, user_input, language="en", max_tokens=512, deadline=None, conversation=None):
+        """Async version of generate_response, for awaiting from FastAPI handlers"""
+        self._require_httpx()
+        prompt, slot = self._prepare(user_input, language, max_tokens, conversation)
+        timeout = httpx.Timeout(deadline or self.timeout, connect=self.connect_timeout)
+
+        try:
+            async with self._asend(
+                self._payload(prompt, max_tokens, language, slot=slot), timeout, conversation
+            ) as response:
+                if response.status_code == 200:
+                    result = response.json()
+                    self._record(conversation, user_input, result["content"], result)
+                    return result["content"].strip()
+                else:
+                    return f"Error: Server returned {response.status_code}"
+
+        except httpx.ConnectError:
+            return CONNECT_ERROR
+        except httpx.TimeoutException:
+            return "Error: llama.cpp server timed out"
         except Exception as e:
             return f"Error: {str(e)}"
+
+    def agenerate_stream(self, user_input, language="en", max_tokens=512, by_sentence=False, deadline=None,
+                         conversation=None):
+        """Async version of generate_stream (an async generator of tokens or sentences)"""
+        tokens = self._astream_tokens(user_input, language, max_tokens, deadline or self.timeout, conversation)
+        if by_sentence:
+            return astream_sentences(tokens)
+        return tokens
+
+    async def _astream_tokens(self, user_input, language, max_tokens, deadline, conversation=None):
+        self._require_httpx()
+        prompt, slot = self._prepare(user_input, language, max_tokens, conversation)
+        timeout = httpx.Timeout(deadline, connect=self.connect_timeout)
+        stats = StreamStats()
+        parts = []
+        last_event = None
+        failed = False
+
+        try:
+            async with self._asend(
+                self._payload(prompt, max_tokens, language, stream=True, slot=slot), timeout, conversation,
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    failed = True
+                    raise LLMError(f"Error: Server returned {response.status_code}")
+
+                async for line in response.aiter_lines():
+                    event = parse_sse_line(line)
+                    if event is None:
+                        continue
+                    last_event = event
+                    token = event.get("content", "")
+                    if token:
+                        stats.token()
+                        parts.append(token)
+                        yield token
+                    if event.get("stop"):
+                        break
+                    if stats.elapsed() > deadline:
+                        failed = True
+                        raise LLMError("Error: llama.cpp server exceeded the deadline")
+
+        except httpx.ConnectError:
+            failed = True
+            raise LLMError(CONNECT_ERROR)
+        except httpx.TimeoutException:
+            failed = True
+            raise LLMError("Error: llama.cpp server timed out")
+        except LLMError:
+            failed = True
+            raise
+        except Exception as e:
+            failed = True
+            raise LLMError(f"Error: {str(e)}") from e
+        finally:
+            # Also runs when the caller closes the stream early (barge-in)
+            if not failed:
+                self._record(conversation, user_input, "".join(parts), last_event)
+
+        stats.report()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        self.session.close()
+        self.backends.close()
+
+
+def parse_sse_line(line):
+    """Parse one "data: {...}" SSE line; None for keep-alives/blank lines"""
+    if not line or not line.startswith("data:"):
+        return None
+    return json.loads(line[len("data:"):].strip())
+
+
+class StreamStats:
+    """Time-to-first-token and decode rate for one streamed generation"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.n_tokens = 0
+
+    def token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            print(f"⚡ Time to first token: {self.first_token_at - self.start:.2f}s")
+        self.n_tokens += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def report(self):
+        total = self.elapsed()
+        if self.first_token_at is not None and self.n_tokens > 1:
+            rate = (self.n_tokens - 1) / max(time.perf_counter() - self.first_token_at, 1e-6)
+            print(f"✅ Streamed {self.n_tokens} tokens in {total:.2f}s ({rate:.1f} tok/s)")
@@ -0,0 +1,114 @@
+import threading
+import time
+
+
+class ModelEntry:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.instance = None
+        self.state = "not_loaded"   # not_loaded -> loading -> warming_up -> ready (or failed)
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Loads each model once, on first use or ahead of time in the background
+
+    Models are registered with a factory. get() builds the model on first use
+    (concurrent callers wait for the same load) and then runs its warmup()
+    method, if it has one, so the first real request doesn't pay for lazy
+    initialization. preload() does the same in background threads, letting a
+    server start listening right away and report readiness once every model
+    is ready.
+
+    Args:
+        warmup: Run each model's warmup() after loading it
+    """
+    def __init__(self, warmup=True):
+        self.warmup = warmup
+        self.entries = {}
+
+    def register(self, name, factory):
+        """Register a zero-argument factory that builds the model"""
+        self.entries[name] = ModelEntry(name, factory)
+
+    def get(self, name):
+        """The loaded model, loading (and warming up) it first if needed"""
+        entry = self.entries[name]
+        if entry.state == "ready":
+            return entry.instance
+        with entry.lock:
+            if entry.state != "ready":
+                self._load(entry)
+        return entry.instance
+
+    def _load(self, entry):
+        entry.state = "loading"
+        entry.error = None
+        start = time.perf_counter()
+        try:
+            instance = entry.factory()
+        except Exception as e:
+            entry.state = "failed"
+            entry.error = str(e)
+            print(f"❌ Failed to load {entry.name}: {e}")
+            raise
+        entry.load_seconds = time.perf_counter() - start
+
+        warmup = getattr(instance, "warmup", None)
+        if self.warmup and warmup is not None:
+            entry.state = "warming_up"
+            start = time.perf_counter()
+            try:
+                warmup()
+            except Exception as e:
+                # The model itself loaded; a failed dummy inference shouldn't make it unusable
+                print(f"⚠️ Warm-up of {entry.name} failed: {e}")
+            entry.warmup_seconds = time.perf_counter() - start
+
+        entry.instance = instance
+        entry.state = "ready"
+        print(f"✅ {entry.name} ready (load {entry.load_seconds:.1f}s"
+              + (f", warm-up {entry.warmup_seconds:.1f}s)" if entry.warmup_seconds is not None else ")"))
+
+    def preload(self, names=None, parallel=True):
+        """Load models in background threads; returns the started threads"""
+        names = list(names or self.entries)
+
+        def load(batch):
+            for name in batch:
+                try:
+                    self.get(name)
+                except Exception:
+                    pass   # already reported; the next get() retries
+
+        batches = [[name] for name in names] if parallel else [names]
+        threads = [threading.Thread(target=load, args=(batch,), daemon=True) for batch in batches]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def is_ready(self, name):
+        return self.entries[name].state == "ready"
+
+    def ready(self, names=None):
+        """Whether every (or every given) model is loaded and warmed up"""
+        return all(self.is_ready(name) for name in (names or self.entries))
+
+    def loaded(self):
+        """{name: instance} for the models loaded so far"""
+        return {name: entry.instance for name, entry in self.entries.items() if entry.state == "ready"}
+
+    def status(self):
+        return {
+            name: {
+                "state": entry.state,
+                "load_seconds": round(entry.load_seconds, 2) if entry.load_seconds is not None else None,
+                "warmup_seconds": round(entry.warmup_seconds, 2) if entry.warmup_seconds is not None else None,
+                "error": entry.error,
+            }
+            for name, entry in self.entries.items()
+        }
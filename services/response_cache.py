@@ -0,0 +1,136 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+
+def normalize_transcript(text):
+    """Lowercase, drop punctuation and collapse whitespace (script-agnostic)"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def digit_sequences(text):
+    """Numbers in a transcript (consumer numbers, amounts, dates), in order"""
+    return re.findall(r"\d+", text)
+
+
+def text_similarity(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+
+class CachedResponse:
+    def __init__(self, transcript, language, text):
+        self.transcript = transcript
+        self.language = language
+        self.text = text
+        self.created = time.monotonic()
+        self.audio = {}   # voice key -> rendered audio file
+        self.hits = 0
+
+
+class ResponseCache:
+    """Cache of LLM responses (and rendered audio) for repeated customer queries
+
+    Entries are keyed on the normalized transcript plus language. Lookups
+    first try an exact key match, then (if fuzzy_threshold is set) the most
+    similar cached transcript in the same language. A fuzzy match must
+    contain exactly the same numbers as the query, so "bill for consumer
+    12345" never answers "bill for consumer 12346".
+
+    Rendered audio is stored per voice, because responses are spoken in the
+    caller's cloned voice. With share_audio=True any cached rendering is
+    returned regardless of voice (use this with a fixed agent voice).
+
+    Args:
+        max_entries: Entries kept before least-recently-used ones are evicted
+        ttl: Seconds an entry stays valid (e.g. the length of an outage notice)
+        fuzzy_threshold: Minimum similarity (0-1) for a fuzzy hit; None (the
+            default) allows exact matches only
+        similarity: Optional scorer(a, b) -> 0..1, e.g. embedding cosine
+            similarity; defaults to difflib's ratio on normalized text
+        share_audio: Reuse audio rendered for a different voice
+    """
+    def __init__(self, max_entries=256, ttl=600, fuzzy_threshold=None, similarity=None, share_audio=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        self.similarity = similarity or text_similarity
+        self.share_audio = share_audio
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.monotonic() - entry.created > self.ttl
+
+    def _find(self, key, language):
+        entry = self.entries.get(key)
+        if entry is not None:
+            return key, entry
+        if self.fuzzy_threshold is None:
+            return None, None
+
+        digits = digit_sequences(key[1])
+        best_key, best_entry, best_score = None, None, self.fuzzy_threshold
+        for other_key, other in self.entries.items():
+            if other.language != language or digit_sequences(other_key[1]) != digits:
+                continue
+            score = self.similarity(key[1], other_key[1])
+            if score >= best_score:
+                best_key, best_entry, best_score = other_key, other, score
+        return best_key, best_entry
+
+    def get(self, transcript, language, voice=None):
+        """Return (response_text, audio_file or None) on a hit, else None"""
+        key = (language, normalize_transcript(transcript))
+        if not key[1]:
+            return None
+
+        with self.lock:
+            found_key, entry = self._find(key, language)
+            if entry is not None and self._expired(entry):
+                del self.entries[found_key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(found_key)
+            entry.hits += 1
+            self.hits += 1
+            audio = entry.audio.get(voice)
+            if audio is None and self.share_audio and entry.audio:
+                audio = next(reversed(entry.audio.values()))
+            return entry.text, audio
+
+    def put(self, transcript, language, text, voice=None, audio_file=None):
+        """Store a response; errors and empty transcripts are not cached"""
+        key = (language, normalize_transcript(transcript))
+        if not key[1] or not text or text.startswith("Error:"):
+            return
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or self._expired(entry) or entry.text != text:
+                entry = CachedResponse(transcript, language, text)
+                self.entries[key] = entry
+            if audio_file:
+                entry.audio[voice] = audio_file
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forget_audio(self, audio_file):
+        """Drop references to an audio file that no longer exists"""
+        with self.lock:
+            for entry in self.entries.values():
+                for voice in [v for v, f in entry.audio.items() if f == audio_file]:
+                    del entry.audio[voice]
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,66 @@
+import re
+
+# Sentence terminators for the languages we serve (Latin punctuation plus the
+# Devanagari danda used in Hindi responses)
+SENTENCE_END = re.compile(r'([.!?।॥]+["\')\]]*)(\s+|$)')
+
+
+class SentenceSplitter:
+    """Incrementally split streamed text into complete sentences
+
+    Args:
+        min_chars: Don't emit sentences shorter than this; they are merged
+            with the following one so TTS isn't called on fragments like "Sir."
+    """
+    def __init__(self, min_chars=20):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, token):
+        """Add a token and return the sentences it completed"""
+        self.buffer += token
+        sentences = []
+        while True:
+            match = None
+            for m in SENTENCE_END.finditer(self.buffer):
+                # A terminator at the very end may still be followed by more
+                # punctuation or a decimal digit, so wait for the next token
+                if m.end() == len(self.buffer) and not m.group(2):
+                    break
+                if m.end(1) >= self.min_chars:
+                    match = m
+                    break
+            if match is None:
+                return sentences
+            sentence = self.buffer[:match.end(1)].strip()
+            self.buffer = self.buffer[match.end():]
+            if sentence:
+                sentences.append(sentence)
+
+    def flush(self):
+        """Return whatever is left once the stream has ended"""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def stream_sentences(tokens, min_chars=20):
+    """Group a stream of text tokens into complete sentences
+
+    Args:
+        tokens: Iterable of text fragments (e.g. streamed LLM tokens)
+        min_chars: Minimum sentence length (see SentenceSplitter)
+    """
+    splitter = SentenceSplitter(min_chars)
+    for token in tokens:
+        yield from splitter.feed(token)
+    yield from splitter.flush()
+
+
+async def astream_sentences(tokens, min_chars=20):
+    """Async version of stream_sentences, for async token streams"""
+    splitter = SentenceSplitter(min_chars)
+    async for token in tokens:
+        for sentence in splitter.feed(token):
+            yield sentence
+    for sentence in splitter.flush():
+        yield sentence
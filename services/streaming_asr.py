@@ -0,0 +1,121 @@
+import numpy as np
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class StreamingTranscriber:
+    """Incremental transcription of one utterance while it is being recorded
+
+    Audio is fed chunk by chunk along with its VAD decision. Once enough new
+    speech has arrived, the undecided part of the utterance is decoded again.
+    Words on which two consecutive decodes agree are confirmed (local
+    agreement), so partial transcripts only ever grow. When the buffer gets
+    longer than `window`, finished segments whose words are all confirmed are
+    committed and their audio is dropped, which keeps every decode short.
+
+    A decode also runs as soon as `end_silence` seconds of silence follow
+    speech, long before the recorder's own silence timeout, so finish() can
+    usually return the final transcript without decoding anything.
+
+    Args:
+        whisper_service: WhisperService used for decoding
+        language: Decode in this language (None = detect on the first decode)
+        sample_rate: Sample rate of the fed audio
+        interval: Seconds of new speech between decodes
+        window: Seconds of undecided audio before finished segments are committed
+        end_silence: Seconds of silence after speech that trigger a decode
+        pad: Seconds of audio kept from before the first speech chunk
+    """
+    def __init__(self, whisper_service, language=None, sample_rate=16000, interval=1.0, window=20.0,
+                 end_silence=0.3, pad=0.3):
+        self.whisper_service = whisper_service
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.window = window
+        self.end_silence = end_silence
+        self.pad = pad
+        self.reset(language)
+
+    def reset(self, language=None):
+        """Start a new utterance"""
+        self.language = language
+        self.chunks = []
+        self.total = 0             # samples received
+        self.buffer_start = None   # first sample not yet committed (None until speech)
+        self.speech_end = 0        # sample after the last speech chunk
+        self.decoded_until = 0     # samples received at the last decode
+        self.committed = []        # words whose audio has been dropped
+        self.confirmed = []        # words of the buffer two decodes agreed on
+        self.hypothesis = []       # words of the last decode of the buffer
+
+    def add(self, audio, is_speech=True):
+        """Append a chunk of mono float32 audio"""
+        self.chunks.append(audio)
+        self.total += len(audio)
+        if is_speech:
+            if self.buffer_start is None:
+                self.buffer_start = max(0, self.total - len(audio) - int(self.pad * self.sample_rate))
+            self.speech_end = self.total
+
+    def pending(self):
+        """Whether a decode now would see speech the last one didn't"""
+        if self.buffer_start is None or self.speech_end <= self.decoded_until:
+            return False
+        new_audio = self.total - max(self.decoded_until, self.buffer_start)
+        trailing_silence = self.total - self.speech_end
+        return (new_audio >= self.interval * self.sample_rate
+                or trailing_silence >= self.end_silence * self.sample_rate)
+
+    def update(self):
+        """Decode the undecided audio again; returns (confirmed text, tentative text)"""
+        if self.buffer_start is None:
+            return "", ""
+        if len(self.chunks) > 1:
+            self.chunks = [np.concatenate(self.chunks)]
+        audio = self.chunks[0][self.buffer_start:]
+        self.decoded_until = self.total
+
+        prompt = " ".join(self.committed[-50:]) or None
+        segments, self.language = self.whisper_service.transcribe_segments(
+            audio, language=self.language, prompt=prompt
+        )
+        words = [word for _, _, text in segments for word in text.split()]
+
+        # Local agreement: extend the confirmed words by what the previous
+        # and the new hypothesis agree on after them
+        n = len(self.confirmed)
+        if words[:n] == self.confirmed and self.hypothesis[:n] == self.confirmed:
+            self.confirmed += words[n:n + _common_prefix(self.hypothesis[n:], words[n:])]
+        self.hypothesis = words
+
+        # Commit finished, fully confirmed segments and drop their audio
+        if len(audio) > self.window * self.sample_rate and len(segments) > 1:
+            finished = sum(len(text.split()) for _, _, text in segments[:-1])
+            if 0 < finished <= len(self.confirmed):
+                self.committed += self.confirmed[:finished]
+                self.confirmed = self.confirmed[finished:]
+                self.hypothesis = self.hypothesis[finished:]
+                self.buffer_start += int(segments[-2][1] * self.sample_rate)
+
+        return self.partial()
+
+    def partial(self):
+        """(confirmed text, tentative text) as of the last decode"""
+        confirmed = " ".join(self.committed + self.confirmed)
+        tentative = " ".join(self.hypothesis[len(self.confirmed):])
+        return confirmed, tentative
+
+    def finish(self):
+        """Final (text, language); decodes again only if speech arrived after the last decode"""
+        if self.buffer_start is None:
+            return "", self.language
+        if self.speech_end > self.decoded_until:
+            self.update()
+        return " ".join(self.committed + self.hypothesis), self.language
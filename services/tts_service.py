@@ -1,5 +1,16 @@
 from TTS.api import TTS
+import hashlib
 import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+
+from services.audio_utils import decode_audio
 
 # Optional pyaudio import for desktop playback
 try:
@@ -11,7 +22,15 @@ except ImportError:
     print("⚠️ PyAudio not available - audio playback disabled (file output still works)")
 
 class TTSService:
-    def __init__(self):
+    def __init__(self, latent_cache_size=32, latent_cache_dir=None, warmup_speaker=None):
+        """
+        Args:
+            latent_cache_size: Speaker references whose XTTS conditioning
+                latents are kept in memory (LRU)
+            latent_cache_dir: Optional folder to persist latents across restarts
+            warmup_speaker: Reference WAV to warm up with (e.g. a fixed agent
+                voice), so its latents are cached before the first request
+        """
         print("Loading TTS models...")
         # Initialize models for different languages
         self.models = {}
@@ -37,6 +56,15 @@ class TTSService:
             self.CHUNK = 1024
         else:
             self.audio = None
+        
+        # Speaker conditioning latents keyed by a hash of the reference audio
+        self.latent_cache = OrderedDict()
+        self.latent_cache_size = latent_cache_size
+        self.latent_lock = threading.Lock()
+        self.latent_cache_dir = Path(latent_cache_dir) if latent_cache_dir else None
+        self.warmup_speaker = warmup_speaker
+        if self.latent_cache_dir:
+            self.latent_cache_dir.mkdir(parents=True, exist_ok=True)
             
         print(f"✅ TTS service ready with {len(self.models)} model(s) loaded")
     
@@ -55,12 +83,21 @@ class TTSService:
                 return True, english_words
         return False, []
     
-    def speak(self, text, output_file="response.wav", speaker_wav=None, language="en", play_audio=True):
-        """Convert text to speech and optionally play it"""
+    def speak(self, text, output_file="response.wav", speaker_wav=None, language="en", play_audio=True, speaker_sr=16000):
+        """Convert text to speech and optionally play it
+        
+        Args:
+            speaker_wav: Reference audio for voice cloning: a file path, or a
+                mono float32 NumPy array sampled at speaker_sr
+        """
+        has_reference_array = isinstance(speaker_wav, np.ndarray)
         print(f"\n🔊 TTS Request:")
         print(f"   Text: {text[:50]}...")
         print(f"   Language: {language}")
-        print(f"   Speaker WAV: {speaker_wav}")
+        if has_reference_array:
+            print(f"   Speaker WAV: <in-memory, {len(speaker_wav) / speaker_sr:.1f}s>")
+        else:
+            print(f"   Speaker WAV: {speaker_wav}")
         print(f"   Output: {output_file}")
         
         # Detect code-mixing
@@ -75,7 +112,12 @@ class TTSService:
                 print(f"🌐 Using XTTS v2 for {language}")
                 
                 # XTTS requires speaker_wav for voice cloning
-                if not speaker_wav or not os.path.exists(speaker_wav):
+                has_reference = (len(speaker_wav) > 0) if has_reference_array else bool(speaker_wav and os.path.exists(speaker_wav))
+                if has_reference:
+                    print(f"   Using voice cloning with: {'in-memory reference' if has_reference_array else speaker_wav}")
+                    gpt_cond_latent, speaker_embedding = self._conditioning(speaker_wav, speaker_sr)
+                    self._xtts_to_file(text, output_file, gpt_cond_latent, speaker_embedding, language)
+                else:
                     print(f"⚠️ WARNING: XTTS requires speaker_wav for voice cloning")
                     print(f"   Using default voice")
                     # Try without speaker_wav (will use default voice)
@@ -84,14 +126,6 @@ class TTSService:
                         file_path=output_file,
                         language=language
                     )
-                else:
-                    print(f"   Using voice cloning with: {speaker_wav}")
-                    model.tts_to_file(
-                        text=text,
-                        file_path=output_file,
-                        speaker_wav=speaker_wav,
-                        language=language
-                    )
             elif 'en' in self.models:
                 # Fallback to English-only model
                 print(f"⚠️ XTTS not available, using English model")
@@ -118,28 +152,178 @@ class TTSService:
             print(traceback.format_exc())
             return False
         
-        # Play the audio only if requested and pyaudio is available
-        if play_audio and PYAUDIO_AVAILABLE and self.audio:
-            with wave.open(output_file, 'rb') as wf:
-                stream = self.audio.open(
-                    format=self.audio.get_format_from_width(wf.getsampwidth()),
-                    channels=wf.getnchannels(),
-                    rate=wf.getframerate(),
-                    output=True
-                )
-                
-                data = wf.readframes(self.CHUNK)
-                while data:
-                    stream.write(data)
-                    data = wf.readframes(self.CHUNK)
-                
-                stream.stop_stream()
-                stream.close()
-        elif play_audio and not PYAUDIO_AVAILABLE:
+        # Play the audio only if requested
+        if play_audio:
+            self.play(output_file)
+
+        return True
+
+    def play(self, audio_file):
+        """Play a WAV file (if pyaudio is available)"""
+        if not (PYAUDIO_AVAILABLE and self.audio):
             print("⚠️ Audio playback skipped (PyAudio not available)")
+            return
+        with wave.open(audio_file, 'rb') as wf:
+            stream = self.audio.open(
+                format=self.audio.get_format_from_width(wf.getsampwidth()),
+                channels=wf.getnchannels(),
+                rate=wf.getframerate(),
+                output=True
+            )
+            
+            data = wf.readframes(self.CHUNK)
+            while data:
+                stream.write(data)
+                data = wf.readframes(self.CHUNK)
+            
+            stream.stop_stream()
+            stream.close()
+
+    def reference_key(self, speaker_wav, speaker_sr):
+        """Content hash of the reference audio (file bytes, or samples + rate)"""
+        digest = hashlib.sha1()
+        if isinstance(speaker_wav, np.ndarray):
+            digest.update(str(speaker_sr).encode())
+            digest.update(np.ascontiguousarray(speaker_wav, dtype=np.float32).tobytes())
+        else:
+            with open(speaker_wav, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+    
+    def _conditioning(self, speaker_wav, speaker_sr=16000):
+        """XTTS conditioning latents for a reference, from cache when possible
         
-        return True
+        Looks in the in-memory LRU first, then the on-disk tier (if
+        latent_cache_dir is set), and only runs the XTTS encoders on a miss.
+        """
+        key = self.reference_key(speaker_wav, speaker_sr)
+        xtts = self.models['xtts'].synthesizer.tts_model
+        
+        with self.latent_lock:
+            if key in self.latent_cache:
+                self.latent_cache.move_to_end(key)
+                print(f"   ♻️ Speaker latents cache hit ({key[:8]})")
+                return self.latent_cache[key]
+        
+        latents = None
+        cache_file = self.latent_cache_dir / f"{key}.pt" if self.latent_cache_dir else None
+        if cache_file and cache_file.exists():
+            try:
+                saved = torch.load(cache_file, map_location=xtts.device)
+                latents = (saved["gpt_cond_latent"], saved["speaker_embedding"])
+                print(f"   💾 Speaker latents loaded from disk ({key[:8]})")
+            except Exception as e:
+                print(f"   ⚠️ Ignoring unreadable latent cache file {cache_file}: {e}")
+        
+        if latents is None:
+            if isinstance(speaker_wav, np.ndarray):
+                reference, reference_sr = speaker_wav, speaker_sr
+            else:
+                reference, reference_sr = decode_audio(speaker_wav, sample_rate=22050), 22050
+            latents = self._compute_conditioning(reference, reference_sr)
+            print(f"   🧮 Speaker latents computed ({key[:8]})")
+            if cache_file:
+                torch.save({"gpt_cond_latent": latents[0], "speaker_embedding": latents[1]}, cache_file)
+        
+        with self.latent_lock:
+            self.latent_cache[key] = latents
+            self.latent_cache.move_to_end(key)
+            while len(self.latent_cache) > self.latent_cache_size:
+                self.latent_cache.popitem(last=False)
+        return latents
+    
+    def _compute_conditioning(self, reference, reference_sr):
+        """Run the XTTS encoders on a reference clip
+        
+        Mirrors what tts_to_file does for a speaker_wav path.
+        """
+        xtts = self.models['xtts'].synthesizer.tts_model
+        config = xtts.config
+        
+        # XTTS conditions on 22.05 kHz audio, capped at max_ref_len seconds
+        ref = torch.from_numpy(np.ascontiguousarray(reference, dtype=np.float32)).unsqueeze(0)
+        if reference_sr != 22050:
+            ref = torchaudio.functional.resample(ref, reference_sr, 22050)
+        ref = ref[:, :22050 * config.max_ref_len].to(xtts.device)
+        if config.sound_norm_refs:
+            ref = (ref / torch.abs(ref).max()) * 0.75
+        
+        gpt_cond_latent = xtts.get_gpt_cond_latents(
+            ref, 22050, length=config.gpt_cond_len, chunk_length=config.gpt_cond_chunk_len
+        )
+        speaker_embedding = xtts.get_speaker_embedding(ref, 22050)
+        return gpt_cond_latent, speaker_embedding
+    
+    def _xtts_to_file(self, text, output_file, gpt_cond_latent, speaker_embedding, language):
+        """Run XTTS inference with precomputed conditioning latents"""
+        xtts = self.models['xtts'].synthesizer.tts_model
+        config = xtts.config
+        
+        out = xtts.inference(
+            text,
+            language,
+            gpt_cond_latent,
+            speaker_embedding,
+            temperature=config.temperature,
+            length_penalty=config.length_penalty,
+            repetition_penalty=config.repetition_penalty,
+            top_k=config.top_k,
+            top_p=config.top_p,
+            enable_text_splitting=True
+        )
+        wav = out["wav"]
+        if torch.is_tensor(wav):
+            wav = wav.cpu().numpy()
+        sf.write(output_file, np.asarray(wav, dtype=np.float32), config.audio.output_sample_rate)
     
+    def stitch(self, segment_files, output_file, gap_seconds=0.15):
+        """Concatenate synthesized sentence files into one WAV file
+
+        Args:
+            segment_files: WAV files in speaking order (left in place)
+            output_file: Path of the stitched WAV file
+            gap_seconds: Silence inserted between sentences
+        """
+        segments = []
+        sample_rate = None
+
+        for i, segment_file in enumerate(segment_files):
+            audio, sr = sf.read(segment_file, dtype='float32')
+            if sample_rate is None:
+                sample_rate = sr
+            if segments and gap_seconds > 0:
+                segments.append(np.zeros(int(sample_rate * gap_seconds), dtype=np.float32))
+            segments.append(audio)
+            print(f"   🧩 Segment {i} ready ({len(audio) / sr:.2f}s)")
+
+        if not segments:
+            print(f"❌ No segments synthesized")
+            return False
+
+        sf.write(output_file, np.concatenate(segments), sample_rate)
+        print(f"✅ Stitched {len(segments)} segment(s) into {output_file}")
+        return True
+
+    def warmup(self):
+        """Synthesize one short phrase so the first real request doesn't pay for lazy initialization
+        
+        With warmup_speaker its latents are computed (and cached) along the
+        way. Otherwise XTTS conditions on a throwaway noise clip that bypasses
+        the latent cache, so it never takes an LRU slot or lands on disk.
+        """
+        output_file = os.path.join(tempfile.gettempdir(), f"tts-warmup-{os.getpid()}.wav")
+        try:
+            if self.warmup_speaker or 'xtts' not in self.models:
+                self.speak("Hello.", output_file=output_file, speaker_wav=self.warmup_speaker, play_audio=False)
+            else:
+                reference = np.random.default_rng(0).normal(0, 0.01, 16000 * 3).astype(np.float32)
+                gpt_cond_latent, speaker_embedding = self._compute_conditioning(reference, 16000)
+                self._xtts_to_file("Hello.", output_file, gpt_cond_latent, speaker_embedding, "en")
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
     def cleanup(self):
         """Clean up audio resources"""
         if PYAUDIO_AVAILABLE and self.audio:
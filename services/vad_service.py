@@ -1,27 +1,202 @@
+import copy
+import os
+import threading
+
 import numpy as np
-import torch
-from collections import deque
+
+# Backends are optional imports: "torch" (torch.hub JIT model) or "onnx"
+# (onnxruntime with a local model file, no PyTorch needed)
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+BACKENDS = ("torch", "onnx")
+DEFAULT_ONNX_MODEL = os.path.join("models", "silero_vad.onnx")
+
+
+class SileroOnnxModel:
+    """Silero VAD v5 ONNX model on onnxruntime, with the torch model's call interface
+    
+    Args:
+        model_path: silero_vad.onnx file
+        threads: onnxruntime intra-op threads (one window is tiny; 1 is usually fastest)
+    """
+    def __init__(self, model_path, threads=1):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.reset_states()
+    
+    def reset_states(self):
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+        self.context = None
+    
+    def fork(self):
+        """A model with its own fresh state, sharing this one's onnxruntime session"""
+        model = copy.copy(self)
+        model.reset_states()
+        return model
+    
+    def __call__(self, window, sample_rate):
+        """Speech probability of one window; the recurrent state carries over to the next call"""
+        context_size = 64 if sample_rate == 16000 else 32
+        window = np.asarray(window, dtype=np.float32).reshape(1, -1)
+        if self.context is None:
+            self.context = np.zeros((1, context_size), dtype=np.float32)
+        model_input = np.concatenate([self.context, window], axis=1)
+        output, self.state = self.session.run(
+            None, {"input": model_input, "state": self.state, "sr": np.array(sample_rate, dtype=np.int64)}
+        )
+        self.context = model_input[:, -context_size:]
+        return float(output[0, 0])
+
+
+def timestamps_from_probs(probs, n_samples, window, threshold, sample_rate, min_speech, min_silence, padding):
+    """Speech (start, end) sample ranges from per-window probabilities
+    
+    Same rules as Silero's get_speech_timestamps: speech starts above
+    `threshold`, ends after min_silence seconds below threshold - 0.15,
+    is dropped if shorter than min_speech, and is padded on both sides
+    (regions whose padding would overlap are split in the middle of the gap).
+    """
+    negative_threshold = max(threshold - 0.15, 0.01)
+    min_speech_samples = int(min_speech * sample_rate)
+    min_silence_samples = int(min_silence * sample_rate)
+    pad = int(padding * sample_rate)
+    
+    speeches = []
+    start = None
+    silence_start = None
+    for i, prob in enumerate(probs):
+        position = i * window
+        if prob >= threshold:
+            silence_start = None
+            if start is None:
+                start = position
+        elif prob < negative_threshold and start is not None:
+            if silence_start is None:
+                silence_start = position
+            if position - silence_start >= min_silence_samples:
+                if silence_start - start > min_speech_samples:
+                    speeches.append([start, silence_start])
+                start = silence_start = None
+    if start is not None and n_samples - start > min_speech_samples:
+        speeches.append([start, n_samples])
+    
+    for i, speech in enumerate(speeches):
+        if i == 0:
+            speech[0] = max(0, speech[0] - pad)
+        if i < len(speeches) - 1:
+            gap = speeches[i + 1][0] - speech[1]
+            if gap < 2 * pad:
+                speech[1] += gap // 2
+                speeches[i + 1][0] -= gap - gap // 2
+            else:
+                speech[1] = min(n_samples, speech[1] + pad)
+                speeches[i + 1][0] = max(0, speeches[i + 1][0] - pad)
+        else:
+            speech[1] = min(n_samples, speech[1] + pad)
+    return [(start, end) for start, end in speeches]
+
+
+class VADStream:
+    """Window-by-window VAD over one continuous audio stream (e.g. one /ws session)
+    
+    Holds its own copy of Silero's recurrent state, so concurrent streams
+    don't mix their audio into each other's state, and whole-buffer passes
+    on the shared model (trim_silence, speech_probs) don't reset it.
+    """
+    def __init__(self, vad, model):
+        self.vad = vad
+        self.model = model
+    
+    def is_speech(self, audio_chunk):
+        """(is speech, probability) of the next window of the stream"""
+        speech_prob = self.vad._speech_prob(self.model, audio_chunk)
+        return speech_prob > self.vad.threshold, speech_prob
+
 
 class VADService:
     """Voice Activity Detection using Silero VAD"""
-    def __init__(self, threshold=0.5, sample_rate=16000):
-        print("Loading Silero VAD model...")
+    def __init__(self, threshold=0.5, sample_rate=16000, backend="torch", onnx_model=None, threads=1):
+        """
+        Args:
+            threshold: Speech probability above which a window counts as speech
+            sample_rate: 16000 or 8000
+            backend: "torch" (downloads the JIT model through torch.hub on a
+                cold cache) or "onnx" (local model file on onnxruntime; starts
+                fast offline and doesn't load PyTorch)
+            onnx_model: Path of silero_vad.onnx for the onnx backend
+            threads: onnxruntime intra-op threads
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown VAD backend '{backend}' (choose from {', '.join(BACKENDS)})")
+        print(f"Loading Silero VAD model ({backend})...")
         self.threshold = threshold
         self.sample_rate = sample_rate
+        self.backend = backend
+        # Window size Silero expects: 512 samples at 16 kHz, 256 at 8 kHz
+        self.window_size = 512 if sample_rate == 16000 else 256
+        # The torch model keeps its recurrent state inside the module, so
+        # whole-buffer passes on the shared model must not interleave
+        self.lock = threading.Lock()
         
-        # Load Silero VAD model
-        self.model, utils = torch.hub.load(
-            repo_or_dir='snakers4/silero-vad',
-            model='silero_vad',
-            force_reload=False,
-            onnx=False
-        )
-        
-        self.get_speech_timestamps = utils[0]
+        if backend == "onnx":
+            if not ONNXRUNTIME_AVAILABLE:
+                raise RuntimeError("onnx VAD backend requested but onnxruntime is not installed (pip install onnxruntime)")
+            onnx_model = onnx_model or DEFAULT_ONNX_MODEL
+            if not os.path.exists(onnx_model):
+                raise RuntimeError(f"Silero ONNX model not found at {onnx_model}")
+            self.model = SileroOnnxModel(onnx_model, threads=threads)
+            self.get_speech_timestamps = None
+        else:
+            if not TORCH_AVAILABLE:
+                raise RuntimeError("torch VAD backend requested but PyTorch is not installed")
+            # Load Silero VAD model
+            self.model, utils = torch.hub.load(
+                repo_or_dir='snakers4/silero-vad',
+                model='silero_vad',
+                force_reload=False,
+                onnx=False
+            )
+            self.get_speech_timestamps = utils[0]
         print("✅ VAD model loaded")
     
+    def warmup(self):
+        """One dummy window through the model, then clear its streaming state"""
+        self.is_speech(np.zeros(512, dtype=np.float32))
+        self.model.reset_states()
+    
+    def stream(self):
+        """VADStream with its own recurrent state, for scoring a live stream window by window"""
+        if self.backend == "onnx":
+            return VADStream(self, self.model.fork())
+        model = copy.deepcopy(self.model)
+        model.reset_states()
+        return VADStream(self, model)
+    
     def is_speech(self, audio_chunk):
         """Check if audio chunk contains speech"""
+        speech_prob = self._speech_prob(self.model, audio_chunk)
+        return speech_prob > self.threshold, speech_prob
+    
+    def _speech_prob(self, model, audio_chunk):
+        """Speech probability of one window through `model` (the shared one or a stream's copy)"""
+        if self.backend == "onnx":
+            return model(np.asarray(audio_chunk).reshape(-1), self.sample_rate)
+        
         # Convert to tensor
         if isinstance(audio_chunk, np.ndarray):
             audio_tensor = torch.from_numpy(audio_chunk).float()
@@ -33,28 +208,87 @@ class VADService:
             audio_tensor = audio_tensor.squeeze()
         
         # Get speech probability
-        speech_prob = self.model(audio_tensor, self.sample_rate).item()
+        return model(audio_tensor, self.sample_rate).item()
+    
+    def speech_timestamps(self, audio_data, padding=0.2, min_speech=0.25, min_silence=0.1):
+        """(start, end) sample ranges that contain speech, padded by `padding` seconds"""
+        if self.backend == "onnx":
+            return timestamps_from_probs(
+                self.speech_probs(audio_data), len(audio_data), self.window_size, self.threshold,
+                self.sample_rate, min_speech, min_silence, padding
+            )
+        audio_tensor = torch.from_numpy(np.ascontiguousarray(audio_data, dtype=np.float32))
+        with self.lock:
+            timestamps = self.get_speech_timestamps(
+                audio_tensor,
+                self.model,
+                threshold=self.threshold,
+                sampling_rate=self.sample_rate,
+                min_speech_duration_ms=int(min_speech * 1000),
+                min_silence_duration_ms=int(min_silence * 1000),
+                speech_pad_ms=int(padding * 1000)
+            )
+        return [(t["start"], t["end"]) for t in timestamps]
+    
+    def trim_silence(self, audio_data, padding=0.2):
+        """Keep only the speech regions (padded), dropping leading, trailing and long inner silence
         
-        return speech_prob > self.threshold, speech_prob
+        Returns an empty array when no speech is found. A single region is
+        returned as a view, without copying.
+        """
+        segments = self.speech_timestamps(audio_data, padding=padding)
+        if not segments:
+            return audio_data[:0]
+        if len(segments) == 1:
+            start, end = segments[0]
+            return audio_data[start:end]
+        return np.concatenate([audio_data[start:end] for start, end in segments])
     
-    def detect_silence(self, audio_data, silence_duration=1.5):
-        """Detect if there's been silence for specified duration"""
-        # Split audio into chunks
-        chunk_size = int(self.sample_rate * 0.5)  # 0.5 second chunks
-        silence_chunks_needed = int(silence_duration / 0.5)
+    def speech_probs(self, audio_data):
+        """Speech probability of every window (512 samples = 32 ms at 16 kHz)
+        
+        The whole buffer goes through the model in one stateful pass, with
+        the recurrent state carried from window to window the way Silero is
+        meant to be fed, and no per-window .item() round trips. A trailing
+        partial window is ignored.
+        """
+        window = self.window_size
+        n_windows = len(audio_data) // window
+        if n_windows == 0:
+            return np.zeros(0, dtype=np.float32)
         
-        recent_chunks = deque(maxlen=silence_chunks_needed)
+        if self.backend == "onnx":
+            frames = np.ascontiguousarray(audio_data[:n_windows * window], dtype=np.float32).reshape(n_windows, window)
+            # A fresh state per pass; the shared session itself is thread-safe
+            model = self.model.fork()
+            return np.array([model(frame, self.sample_rate) for frame in frames], dtype=np.float32)
         
-        for i in range(0, len(audio_data), chunk_size):
-            chunk = audio_data[i:i + chunk_size]
-            if len(chunk) < chunk_size:
-                break
-            
-            is_speech, prob = self.is_speech(chunk)
-            recent_chunks.append(is_speech)
+        audio_tensor = torch.from_numpy(np.ascontiguousarray(audio_data[:n_windows * window], dtype=np.float32))
+        
+        with self.lock, torch.inference_mode():
+            self.model.reset_states()
+            if hasattr(self.model, "audio_forward"):
+                probs = self.model.audio_forward(audio_tensor.unsqueeze(0), self.sample_rate)[0]
+            else:
+                probs = torch.cat([
+                    self.model(frame, self.sample_rate).reshape(-1)
+                    for frame in audio_tensor.reshape(n_windows, window)
+                ])
+            self.model.reset_states()
+        return probs.reshape(-1)[:n_windows].numpy()
+    
+    def detect_silence(self, audio_data, silence_duration=1.5, context=0.5):
+        """Detect if the last silence_duration seconds of audio are silence
         
-        # Check if all recent chunks are silence
-        if len(recent_chunks) == silence_chunks_needed:
-            return not any(recent_chunks)
+        Only the tail is scored, plus `context` seconds before it to settle
+        the model's state.
+        """
+        window = self.window_size
+        windows_needed = int(silence_duration * self.sample_rate / window)
+        if len(audio_data) < windows_needed * window:
+            return False
         
-        return False
+        tail_windows = windows_needed + int(context * self.sample_rate / window)
+        tail = audio_data[max(0, len(audio_data) - tail_windows * window):]
+        probs = self.speech_probs(tail[len(tail) % window:])
+        return not np.any(probs[-windows_needed:] > self.threshold)
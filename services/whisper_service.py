@@ -1,32 +1,315 @@
-import whisper
+import threading
+import time
+from collections import OrderedDict
+
 import numpy as np
 import soundfile as sf
 
+from services.audio_utils import decode_audio, prepare_audio
+
+# ASR backends are optional imports; at least one must be installed
+try:
+    import whisper
+    import torch
+    OPENAI_WHISPER_AVAILABLE = True
+except ImportError:
+    OPENAI_WHISPER_AVAILABLE = False
+
+try:
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+BACKENDS = ("openai", "faster-whisper")
+
 class WhisperService:
-    def __init__(self, model_size="large-v3"):
-        print("Loading Whisper model...")
-        self.model = whisper.load_model(model_size)
+    def __init__(self, model_size="large-v3", backend="openai", compute_type="int8", device="cpu", cpu_threads=0,
+                 languages=("en", "hi", "te")):
+        """
+        Args:
+            model_size: Whisper model (tiny/base/small/medium/large-v3/...)
+            backend: "openai" (openai-whisper, PyTorch fp32 on CPU) or
+                "faster-whisper" (CTranslate2, quantized; much faster on CPU)
+            compute_type: CTranslate2 compute type for faster-whisper
+                (int8, int8_float32, float32, ...)
+            device: "cpu" or "cuda" (faster-whisper only)
+            cpu_threads: faster-whisper intra-op threads (0 = library default)
+            languages: Allowed languages for detection (None = any language
+                Whisper knows). Restricting it stops Hindi/Telugu callers being
+                detected as Urdu/Marathi.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown ASR backend '{backend}' (choose from {', '.join(BACKENDS)})")
+        self.backend = backend
+        self.model_size = model_size
+        self.languages = tuple(languages) if languages else None
+
+        print(f"Loading Whisper model ({model_size}, {backend})...")
+        if backend == "faster-whisper":
+            if not FASTER_WHISPER_AVAILABLE:
+                raise RuntimeError("faster-whisper backend requested but not installed (pip install faster-whisper)")
+            self.model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+        else:
+            if not OPENAI_WHISPER_AVAILABLE:
+                raise RuntimeError("openai-whisper backend requested but not installed (pip install openai-whisper)")
+            self.model = whisper.load_model(model_size)
         print("✅ Whisper model loaded")
-    
-    def transcribe(self, audio_file):
-        """Convert speech to text with language detection"""
-        # Load audio directly without ffmpeg
-        audio, sr = sf.read(audio_file, dtype='float32')
-        
-        # Convert to mono if stereo
-        if len(audio.shape) > 1:
-            audio = audio.mean(axis=1)
-        
-        # Resample to 16kHz if needed
-        if sr != 16000:
-            import scipy.signal
-            audio = scipy.signal.resample(audio, int(len(audio) * 16000 / sr))
-        
-        # Ensure float32 type for Whisper
-        audio = np.array(audio, dtype=np.float32)
-        
+
+    def _load(self, audio_file):
+        """Mono 16 kHz float32 samples from a path or an array"""
+        if isinstance(audio_file, np.ndarray):
+            audio, sr = audio_file, 16000
+        else:
+            try:
+                # Load audio directly without ffmpeg
+                audio, sr = sf.read(audio_file, dtype='float32')
+            except RuntimeError:
+                # Formats libsndfile can't read (webm, m4a, ...) go through ffmpeg
+                return decode_audio(audio_file, sample_rate=16000)
+
+        # Mono 16 kHz float32 (in-place downmix, cached polyphase resampler)
+        return prepare_audio(audio, sr, 16000)
+
+    def warmup(self):
+        """One dummy transcription (detection + decode) so the first real one runs at full speed"""
+        self.transcribe(np.zeros(16000, dtype=np.float32))
+
+    def _pick_language(self, probs):
+        """Most likely language, restricted to the allow-list"""
+        if not self.languages:
+            return max(probs, key=probs.get)
+        return max(self.languages, key=lambda language: probs.get(language, 0.0))
+
+    def detect_language(self, audio_file):
+        """Detect the language from the first 30 s window only
+
+        Args:
+            audio_file: Path to an audio file, or a mono 16 kHz float32 NumPy array
+        """
+        audio = self._load(audio_file)
+        first_window = audio[:16000 * 30]
+
+        if self.backend == "faster-whisper":
+            _, _, all_probs = self.model.detect_language(first_window)
+            return self._pick_language(dict(all_probs))
+
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(first_window), n_mels=self.model.dims.n_mels)
+        _, probs = self.model.detect_language(mel.to(self.model.device))
+        return self._pick_language(probs)
+
+    def transcribe(self, audio_file, language=None):
+        """Convert speech to text with language detection
+
+        Args:
+            audio_file: Path to an audio file, or a mono 16 kHz float32 NumPy array
+            language: Decode in this language and skip detection (e.g. the
+                language already detected for this caller)
+        """
+        segments, language = self.transcribe_segments(audio_file, language=language)
+        text = "".join(segment_text for _, _, segment_text in segments).strip()
+        return text, language
+
+    def transcribe_segments(self, audio_file, language=None, prompt=None):
+        """Like transcribe(), but returns ([(start_s, end_s, text), ...], language)
+
+        Args:
+            audio_file: Path to an audio file, or a mono 16 kHz float32 NumPy array
+            language: Decode in this language and skip detection
+            prompt: Text that precedes this audio (e.g. already committed
+                words when decoding a stream piece by piece)
+        """
+        audio = self._load(audio_file)
+
+        # Detect once, restricted to the allowed languages, then decode with it fixed
+        if language is None:
+            language = self.detect_language(audio)
+
         # Transcribe
-        result = self.model.transcribe(audio, language=None, fp16=False)
-        detected_lang = result.get("language", "en")
-        text = result["text"].strip()
-        return text, detected_lang
+        if self.backend == "faster-whisper":
+            segments, _ = self.model.transcribe(audio, language=language, beam_size=5, initial_prompt=prompt)
+            # segments is a generator; decoding happens while it is consumed
+            return [(segment.start, segment.end, segment.text) for segment in segments], language
+
+        result = self.model.transcribe(audio, language=language, fp16=False, initial_prompt=prompt)
+        return [(segment["start"], segment["end"], segment["text"]) for segment in result["segments"]], language
+
+    def transcribe_batch(self, audio_files, batch_size=8):
+        """Transcribe many files/arrays, batching them through the model
+
+        With openai-whisper language is detected on each file's first 30 s
+        window (batched), then the files are decoded in rounds: every file's
+        next 30 s window goes into mel batches that run through the encoder
+        and decoder together, grouped by language, and each file then seeks
+        to the end of its last complete segment like transcribe() does, so
+        words at a window edge aren't cut or repeated. Windows that decode
+        degenerately (repetition loops) make that file fall back to
+        transcribe(), which has temperature fallback. With faster-whisper
+        each file is decoded with its batched pipeline.
+
+        The text can still differ slightly from transcribe() on the same
+        file: windows are decoded greedily at one temperature and without
+        the previous window's text as a prompt. Use transcribe() where exact
+        parity matters.
+
+        Files are loaded and decoded batch_size at a time, so only one group
+        of decoded audio is in memory at once.
+
+        Args:
+            audio_files: Paths or mono 16 kHz float32 arrays
+            batch_size: Files per group, and windows per encoder/decoder batch
+
+        Returns:
+            List of (text, language) in input order; None for inputs that
+            couldn't be loaded (call transcribe() on them to get the error)
+        """
+        results = []
+        for start in range(0, len(audio_files), batch_size):
+            audios = []
+            for audio_file in audio_files[start:start + batch_size]:
+                try:
+                    audios.append(self._load(audio_file))
+                except Exception as e:
+                    print(f"⚠️ Could not load {audio_file}: {e}")
+                    audios.append(None)
+            results.extend(self._transcribe_group(audios, batch_size, first=start))
+        return results
+
+    def _transcribe_group(self, audios, batch_size, first=0):
+        if self.backend == "faster-whisper":
+            pipeline = BatchedInferencePipeline(model=self.model)
+            results = []
+            for audio in audios:
+                if audio is None:
+                    results.append(None)
+                    continue
+                language = self.detect_language(audio)
+                segments, _ = pipeline.transcribe(audio, language=language, batch_size=batch_size)
+                results.append(("".join(segment.text for segment in segments).strip(), language))
+            return results
+
+        return self._transcribe_batch_openai(audios, batch_size, first)
+
+    def _transcribe_batch_openai(self, audios, batch_size, first=0):
+        n_mels = self.model.dims.n_mels
+        window = whisper.audio.N_SAMPLES
+
+        def mel(samples):
+            return whisper.log_mel_spectrogram(whisper.pad_or_trim(samples), n_mels=n_mels)
+
+        # Language ID on each file's first window
+        active = [i for i, audio in enumerate(audios) if audio is not None]
+        languages = {}
+        for b in range(0, len(active), batch_size):
+            batch = active[b:b + batch_size]
+            mels = torch.stack([mel(audios[i][:window]) for i in batch]).to(self.model.device)
+            _, probs = self.model.detect_language(mels)
+            for i, lang_probs in zip(batch, probs):
+                languages[i] = self._pick_language(lang_probs)
+
+        # Decode in rounds: every file's next 30 s window goes into the
+        # batches (one language per batch), then each file seeks to the end
+        # of its last complete segment, as whisper.transcribe does, so a word
+        # cut off at the window edge is decoded whole in the next round
+        samples_per_timestamp = whisper.audio.HOP_LENGTH * (whisper.audio.N_FRAMES // self.model.dims.n_audio_ctx)
+        seeks = {i: 0 for i in active}
+        texts = {i: [] for i in active}
+        fallback = set()
+        while True:
+            pending = [i for i in active if i not in fallback and seeks[i] < len(audios[i])]
+            if not pending:
+                break
+            for language in set(languages[i] for i in pending):
+                group = [i for i in pending if languages[i] == language]
+                tokenizer = whisper.tokenizer.get_tokenizer(
+                    self.model.is_multilingual, num_languages=self.model.num_languages,
+                    language=language, task="transcribe"
+                )
+                options = whisper.DecodingOptions(language=language, fp16=False)
+                for b in range(0, len(group), batch_size):
+                    batch = group[b:b + batch_size]
+                    segments = [audios[i][seeks[i]:seeks[i] + window] for i in batch]
+                    mels = torch.stack([mel(samples) for samples in segments]).to(self.model.device)
+                    for i, samples, result in zip(batch, segments, whisper.decode(self.model, mels, options)):
+                        if result.compression_ratio > 2.4:
+                            fallback.add(i)
+                            continue
+                        # Same silence rule as whisper.transcribe: skip the whole window
+                        if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+                            seeks[i] += len(samples)
+                            continue
+                        tokens, advance = split_at_last_timestamp(
+                            result.tokens, tokenizer.timestamp_begin, len(samples), samples_per_timestamp
+                        )
+                        seeks[i] += advance
+                        texts[i].append(tokenizer.decode(tokens).strip())
+                print(f"   ✅ Decoded {len(group)} window(s) in {language}")
+
+        results = []
+        for i, audio in enumerate(audios):
+            if audio is None:
+                results.append(None)
+            elif i in fallback:
+                print(f"   🔁 File {first + i + 1}: degenerate batch output, re-decoding with fallback")
+                results.append(self.transcribe(audio, language=languages[i]))
+            else:
+                results.append((" ".join(t for t in texts[i] if t), languages[i]))
+        return results
+
+
+def split_at_last_timestamp(tokens, timestamp_begin, segment_samples, samples_per_timestamp):
+    """(tokens to keep, samples to advance) for one decoded 30 s window
+
+    Mirrors how whisper.transcribe seeks: when the window ends inside a
+    segment (its last timestamp pair closes an earlier segment), only the
+    tokens up to that pair are kept and the next window starts at its
+    timestamp; otherwise the whole window is consumed.
+    """
+    tokens = list(tokens)
+    is_timestamp = [token >= timestamp_begin for token in tokens]
+    single_timestamp_ending = is_timestamp[-2:] == [False, True]
+    consecutive = [k for k in range(1, len(tokens)) if is_timestamp[k - 1] and is_timestamp[k]]
+    if consecutive and not single_timestamp_ending:
+        last_slice = consecutive[-1]
+        advance = (tokens[last_slice - 1] - timestamp_begin) * samples_per_timestamp
+        if 0 < advance < segment_samples:
+            return tokens[:last_slice], advance
+    return tokens, segment_samples
+
+
+class SessionLanguages:
+    """Remembers each caller's detected language so later turns skip detection
+
+    Args:
+        max_sessions: Sessions remembered before the least recent is dropped
+        ttl: Seconds of inactivity after which a session's language is forgotten
+    """
+    def __init__(self, max_sessions=1024, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            language, last_seen = entry
+            if time.monotonic() - last_seen > self.ttl:
+                del self.sessions[session_id]
+                return None
+            self.sessions[session_id] = (language, time.monotonic())
+            self.sessions.move_to_end(session_id)
+            return language
+
+    def set(self, session_id, language):
+        if not session_id:
+            return
+        with self.lock:
+            self.sessions[session_id] = (language, time.monotonic())
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
@@ -0,0 +1,41 @@
+import pytest
+
+from services.intent_classifier import IntentClassifier
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier()
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("What is the helpline number?", "helpline"),
+    ("customer care number please", "helpline"),
+    ("How can I pay my electricity bill?", "bill_payment"),
+    ("i want a new connection", "new_connection"),
+    ("There is no power in my area", "power_outage"),
+    ("हेल्पलाइन नंबर क्या है", "helpline"),
+    ("మా ప్రాంతంలో కరెంట్ లేదు", "power_outage"),
+])
+def test_clear_questions_use_the_template(classifier, query, intent):
+    result = classifier.classify(query)
+    assert result is not None and result[0] == intent
+
+
+@pytest.mark.parametrize("query", [
+    # Generic words that happen to overlap an intent's keywords
+    "my phone number changed, update it",
+    "what is the contact number",
+    "my phone number is wrong in the bill",
+    # A FAQ question plus something the template doesn't answer
+    "What's the customer care number? Also my meter is broken",
+    "customer care number, my bill is too high",
+    "no power and my meter is sparking",
+    "hello my meter is broken",
+    "thanks, also my bill is wrong",
+    # Exclude words
+    "I paid my bill twice",
+    "new connection status pending",
+])
+def test_other_queries_go_to_the_llm(classifier, query):
+    assert classifier.classify(query) is None
@@ -1,9 +1,10 @@
 import asyncio
+import os
+import tempfile
 import sounddevice as sd
-import soundfile as sf
 import numpy as np
+import threading
 import time
-from collections import deque
 
 # Pipecat imports
 from pipecat.frames.frames import Frame, AudioRawFrame, TextFrame, EndFrame
@@ -16,6 +17,11 @@ from services.llm_service_api import LLMService
 from services.whisper_service import WhisperService
 from services.tts_service import TTSService
 from services.vad_service import VADService
+from services.model_registry import ModelRegistry
+from services.audio_utils import RingBuffer
+from services.conversation import Conversation
+from services.streaming_asr import StreamingTranscriber
+from services.intent_classifier import IntentClassifier
 
 class LLMProcessor(FrameProcessor):
     """Pipecat processor for LLM"""
@@ -43,12 +49,9 @@ class WhisperProcessor(FrameProcessor):
         await super().process_frame(frame, direction)
         
         if isinstance(frame, AudioRawFrame):
-            # Transcribe audio
-            # Save audio temporarily
-            audio_file = "temp_audio.wav"
-            sf.write(audio_file, frame.audio, frame.sample_rate)
-            
-            text, lang = self.whisper_service.transcribe(audio_file)
+            # Transcribe audio straight from the frame buffer
+            audio = np.asarray(frame.audio, dtype=np.float32).reshape(-1)
+            text, lang = self.whisper_service.transcribe(audio)
             print(f"📝 Transcribed: {text}")
             
             await self.push_frame(TextFrame(text))
@@ -56,24 +59,65 @@ class WhisperProcessor(FrameProcessor):
             await self.push_frame(frame)
 
 class VoiceAgentPipecat:
-    def __init__(self, silence_duration=5.0):
+    def __init__(self, silence_duration=5.0, streaming_asr=True, faq_fast_path=True):
         print("Initializing Pipecat Voice Agent...")
         
-        # Initialize services
-        self.llm_service = LLMService()
-        self.whisper_service = WhisperService()
-        self.tts_service = TTSService()
-        
-        # VAD service
-        self.vad_service = VADService(threshold=0.3)
+        # Load (and warm up) every model in parallel in the background;
+        # each first use waits only for the model it needs
+        self.models = ModelRegistry()
+        self.models.register("vad", lambda: VADService(threshold=0.3))
+        self.models.register("asr", WhisperService)
+        self.models.register("llm", LLMService)
+        self.models.register("tts", TTSService)
+        self.models.preload()
         
         # Audio settings
         self.RATE = 16000
         self.CHANNELS = 1
         self.SILENCE_DURATION = silence_duration
+        self.MAX_RECORD_SECONDS = 120.0
+        
+        # Recording buffer, allocated once and reused for every utterance
+        self.ring_buffer = RingBuffer(int(self.MAX_RECORD_SECONDS * self.RATE))
+        
+        # Voice-cloning reference for this session. Reusing the same clip
+        # every turn lets TTSService serve the XTTS latents from its cache.
+        self.speaker_reference = None
+        # Caller's language, detected on the first turn and fixed afterwards
+        self.language = None
+        # Dialogue so far, so the caller doesn't have to repeat details every turn
+        self.conversation = Conversation("local")
+        self.MIN_REFERENCE_SECONDS = 3.0
+        self.REFERENCE_MAX_SECONDS = 12.0
+        
+        # Transcribe while the user is still speaking, so the final transcript
+        # is ready when the silence timeout ends the recording (created on first use)
+        self.streaming_asr = streaming_asr
+        self.transcriber = None
+        
+        # Clear FAQ questions are answered from templates instead of the LLM;
+        # each answer is rendered once per voice and replayed afterwards
+        self.intent_classifier = IntentClassifier() if faq_fast_path else None
+        self.faq_audio_dir = tempfile.mkdtemp(prefix="faq-audio-")
         
         print(f"✅ Pipecat Voice Agent initialized! (Silence: {silence_duration}s)")
     
+    @property
+    def vad_service(self):
+        return self.models.get("vad")
+    
+    @property
+    def whisper_service(self):
+        return self.models.get("asr")
+    
+    @property
+    def llm_service(self):
+        return self.models.get("llm")
+    
+    @property
+    def tts_service(self):
+        return self.models.get("tts")
+    
     async def process_with_pipeline(self, audio_data):
         """Process audio through Pipecat pipeline"""
         # Create processors
@@ -109,29 +153,53 @@ class VoiceAgentPipecat:
         return responses[-1] if responses else None
     
     def record_audio_vad(self):
-        """Record audio with VAD auto-stop"""
+        """Record audio with VAD auto-stop
+        
+        The audio callback only copies samples into a preallocated ring
+        buffer. A separate thread runs VAD on 32 ms (512-sample) windows and
+        stops the recording after SILENCE_DURATION of silence. The utterance
+        is returned as a view of the buffer, without a final copy; it stays
+        valid until the next recording starts.
+        """
+        # Wait for the models here, never inside the audio callback
+        vad_service = self.vad_service
+        if self.streaming_asr and self.transcriber is None:
+            self.transcriber = StreamingTranscriber(self.whisper_service, sample_rate=self.RATE)
         print("\n🎤 Recording... (auto-stops after silence)")
         
-        frames = []
-        recording = [True]
+        ring = self.ring_buffer
+        ring.reset()
+        speech_flags = []
+        stop = threading.Event()
+        overflows = [0]
         vad_chunk_size = 512
-        silence_chunks = deque(maxlen=int(self.SILENCE_DURATION / 0.032))
+        silence_windows_needed = int(self.SILENCE_DURATION / 0.032)
         
         def callback(indata, frame_count, time_info, status):
-            if not recording[0]:
+            if status.input_overflow:
+                overflows[0] += 1
+            if stop.is_set():
                 return
-            
-            frames.append(indata.copy())
-            
-            # VAD check
-            if len(indata) == vad_chunk_size:
-                is_speech, prob = self.vad_service.is_speech(indata.flatten())
-                silence_chunks.append(not is_speech)
-                
-                if len(silence_chunks) == silence_chunks.maxlen:
-                    if all(silence_chunks):
-                        print("\n🔇 Silence detected, stopping...")
-                        recording[0] = False
+            if ring.written + frame_count > ring.capacity:
+                print(f"\n⏱️ Reached {self.MAX_RECORD_SECONDS:.0f}s, stopping...")
+                stop.set()
+                return
+            ring.write(indata[:, 0])
+        
+        def vad_worker():
+            position = 0
+            silent_windows = 0
+            while not stop.is_set():
+                if ring.written - position < vad_chunk_size:
+                    time.sleep(0.005)
+                    continue
+                is_speech, prob = vad_service.is_speech(ring.read(position, vad_chunk_size))
+                speech_flags.append(is_speech)
+                position += vad_chunk_size
+                silent_windows = 0 if is_speech else silent_windows + 1
+                if silent_windows >= silence_windows_needed:
+                    print("\n🔇 Silence detected, stopping...")
+                    stop.set()
         
         stream = sd.InputStream(
             samplerate=self.RATE,
@@ -141,16 +209,37 @@ class VoiceAgentPipecat:
             blocksize=vad_chunk_size
         )
         
+        if self.transcriber:
+            self.transcriber.reset(self.language)
+        fed = 0
+        
+        vad_thread = threading.Thread(target=vad_worker, daemon=True)
         stream.start()
-        while recording[0]:
-            time.sleep(0.1)
+        vad_thread.start()
+        while not stop.is_set():
+            if self.transcriber is None:
+                stop.wait(0.1)
+                continue
+            
+            # Feed the windows VAD has scored so far, and re-decode (on this
+            # thread, not the audio callback or the VAD thread) when due
+            while fed < len(speech_flags):
+                self.transcriber.add(ring.read(fed * vad_chunk_size, vad_chunk_size), speech_flags[fed])
+                fed += 1
+            if self.transcriber.pending():
+                confirmed, tentative = self.transcriber.update()
+                print(f"\r📝 {confirmed} \033[2m{tentative}\033[0m", end="", flush=True)
+            else:
+                stop.wait(0.03)
         stream.stop()
         stream.close()
+        vad_thread.join()
         
-        if frames:
-            audio_data = np.concatenate(frames, axis=0)
+        if overflows[0]:
+            print(f"⚠️ {overflows[0]} input overflow(s) while recording")
+        if ring.written:
             print("✅ Recording stopped")
-            return audio_data
+            return ring.contents()
         else:
             print("⚠️ No audio recorded")
             return None
@@ -172,13 +261,20 @@ class VoiceAgentPipecat:
                 if audio_data is None:
                     continue
                 
-                # Save for TTS voice cloning
-                audio_file = "temp_audio.wav"
-                sf.write(audio_file, audio_data, self.RATE)
+                # Whisper only sees the speech, not the trailing silence timeout
+                audio_data = self.vad_service.trim_silence(audio_data)
+                if len(audio_data) == 0:
+                    print("⚠️ No speech detected")
+                    continue
                 
-                # Transcribe
-                print("🔄 Transcribing...")
-                user_text, detected_lang = self.whisper_service.transcribe(audio_file)
+                # Transcribe (streaming mode only decodes speech that came after its last pass)
+                if self.transcriber:
+                    user_text, detected_lang = self.transcriber.finish()
+                else:
+                    print("🔄 Transcribing...")
+                    user_text, detected_lang = self.whisper_service.transcribe(audio_data, language=self.language)
+                if user_text:
+                    self.language = detected_lang
                 lang_names = {"en": "English", "hi": "Hindi", "te": "Telugu"}
                 print(f"🌐 Language: {lang_names.get(detected_lang, detected_lang)}")
                 print(f"📝 You said: {user_text}")
@@ -188,14 +284,27 @@ class VoiceAgentPipecat:
                     print("👋 Goodbye!")
                     break
                 
-                # Generate response using Pipecat pipeline
-                print("🤔 Thinking (via Pipecat pipeline)...")
-                response = self.llm_service.generate_response(user_text, language=detected_lang)
+                faq = self.intent_classifier.match(user_text, detected_lang) if self.intent_classifier and user_text else None
+                if faq:
+                    response = faq.answer
+                    self.conversation.add_turn(user_text, response)
+                else:
+                    # Generate response using Pipecat pipeline
+                    print("🤔 Thinking (via Pipecat pipeline)...")
+                    response = self.llm_service.generate_response(
+                        user_text, language=detected_lang, conversation=self.conversation
+                    )
                 print(f"💬 Assistant: {response}")
                 
                 # Speak response
                 print("🔊 Speaking...")
-                self.tts_service.speak(response, speaker_wav=audio_file, language=detected_lang)
+                if self.speaker_reference is None or len(self.speaker_reference) < self.MIN_REFERENCE_SECONDS * self.RATE:
+                    # Copied: audio_data is a view of the recording buffer, reused next turn
+                    self.speaker_reference = audio_data[:int(self.REFERENCE_MAX_SECONDS * self.RATE)].copy()
+                if faq:
+                    self.speak_faq(faq)
+                else:
+                    self.tts_service.speak(response, speaker_wav=self.speaker_reference, language=detected_lang, speaker_sr=self.RATE)
                 
                 print("\n" + "-"*50 + "\n")
                     
@@ -204,9 +313,24 @@ class VoiceAgentPipecat:
         finally:
             self.cleanup()
     
+    def speak_faq(self, match):
+        """Play a templated answer, rendering it in the caller's voice the first time"""
+        voice = self.tts_service.reference_key(self.speaker_reference, self.RATE)
+        audio_file = self.intent_classifier.get_audio(match, voice)
+        if audio_file and os.path.exists(audio_file):
+            print("⚡ Replaying rendered FAQ answer")
+            self.tts_service.play(audio_file)
+            return
+        audio_file = os.path.join(self.faq_audio_dir, f"{match.intent}-{match.language}-{voice[:12]}.wav")
+        if self.tts_service.speak(match.answer, output_file=audio_file, speaker_wav=self.speaker_reference,
+                                  language=match.language, speaker_sr=self.RATE):
+            self.intent_classifier.set_audio(match, voice, audio_file)
+    
     def cleanup(self):
         """Clean up resources"""
-        self.tts_service.cleanup()
+        tts_service = self.models.loaded().get("tts")
+        if tts_service:
+            tts_service.cleanup()
         print("✅ Cleaned up resources")
 
 if __name__ == "__main__":
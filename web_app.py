@@ -1,19 +1,217 @@
-from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, File, Form, UploadFile, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
 import uvicorn
 import soundfile as sf
 import asyncio
+import json
+import os
+import threading
+import uuid
+from collections import deque
 from pathlib import Path
-from services.llm_service_api import LLMService
-from services.whisper_service import WhisperService
+import numpy as np
+from services.llm_service_api import LLMService, LLMError
+from services.whisper_service import WhisperService, SessionLanguages
 from services.tts_service import TTSService
+from services.vad_service import VADService
+from services.inference_pool import InferencePool, ServerBusy
+from services.audio_utils import decode_audio
+from services.response_cache import ResponseCache
+from services.intent_classifier import IntentClassifier, DEFAULT_INTENTS_FILE
+from services.audio_store import AudioStore
+from services.model_registry import ModelRegistry
+from services.conversation import ConversationStore
+from services.sentences import stream_sentences
 
 app = FastAPI(title="Voice Agent Web")
 
-# Initialize services
-llm_service = LLMService()
-whisper_service = WhisperService()
-tts_service = TTSService()
+# Models load lazily on first use, or in the background at startup
+# (PRELOAD_MODELS=1) while the server already answers /healthz
+models = ModelRegistry(warmup=os.getenv("WARMUP_MODELS", "1") == "1")
+# LLM_BACKENDS: comma-separated llama-server URLs; requests go to the least busy one.
+# LLM_DISCOVER=1 also treats every address a host name resolves to as a server
+# (one per container of `docker compose --scale llama-server=N`).
+# LLM_PROMPT_SLOTS: language:slot pairs (e.g. en:0,hi:1,te:2) pinning each
+# language's system prompt to a llama-server slot (start it with -np >= 3)
+models.register("llm", lambda: LLMService(
+    backends=[u.strip() for u in os.getenv("LLM_BACKENDS", "http://localhost:8080").split(",") if u.strip()],
+    discover=os.getenv("LLM_DISCOVER", "0") == "1",
+    prompt_slots={
+        language.strip(): int(slot)
+        for language, _, slot in (p.partition(":") for p in os.getenv("LLM_PROMPT_SLOTS", "").split(",") if p.strip())
+    }
+))
+models.register("asr", lambda: WhisperService(
+    model_size=os.getenv("ASR_MODEL", "large-v3"),
+    backend=os.getenv("ASR_BACKEND", "openai"),
+    compute_type=os.getenv("ASR_COMPUTE_TYPE", "int8"),
+    languages=[l.strip() for l in os.getenv("ASR_LANGUAGES", "en,hi,te").split(",") if l.strip()] or None
+))
+models.register("tts", lambda: TTSService(
+    latent_cache_dir=os.getenv("XTTS_LATENT_CACHE_DIR"),
+    warmup_speaker=os.getenv("FAQ_VOICE")
+))
+models.register("vad", lambda: VADService(
+    backend=os.getenv("VAD_BACKEND", "torch"),
+    onnx_model=os.getenv("VAD_ONNX_MODEL"),
+    threads=int(os.getenv("VAD_THREADS", "1"))
+))
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") == "1"
+
+async def model(name):
+    """A loaded model; a first-use load runs off the event loop"""
+    if models.is_ready(name):
+        return models.get(name)
+    return await asyncio.to_thread(models.get, name)
+
+# Language detected on a caller's first turn; later turns decode with it fixed
+session_languages = SessionLanguages(ttl=float(os.getenv("ASR_LANGUAGE_TTL", "1800")))
+
+# Blocking model calls run on dedicated executors; requests beyond
+# MAX_ACTIVE_REQUESTS + MAX_QUEUED_REQUESTS get 503 with Retry-After
+inference = InferencePool(
+    workers={
+        "decode": int(os.getenv("DECODE_WORKERS", "2")),
+        "vad": int(os.getenv("VAD_WORKERS", "1")),
+        "asr": int(os.getenv("ASR_WORKERS", "1")),
+        "llm": int(os.getenv("LLM_WORKERS", "4")),
+        "tts": int(os.getenv("TTS_WORKERS", "1")),
+    },
+    max_active=int(os.getenv("MAX_ACTIVE_REQUESTS", "2")),
+    max_queued=int(os.getenv("MAX_QUEUED_REQUESTS", "8"))
+)
+
+# Responses to repeated queries, keyed on normalized transcript + language
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "600")),
+    fuzzy_threshold=float(os.getenv("RESPONSE_CACHE_FUZZY", "0")) or None,
+    share_audio=os.getenv("RESPONSE_CACHE_SHARE_AUDIO", "0") == "1"
+)
+
+# Clear FAQ questions (helpline, how to pay, ...) are answered from templates
+# without the LLM. With FAQ_VOICE (a reference WAV for a fixed agent voice)
+# every answer is rendered once at startup; otherwise each answer is rendered
+# in the caller's cloned voice on first use and reused for that voice.
+intent_classifier = (
+    IntentClassifier(os.getenv("FAQ_FILE") or DEFAULT_INTENTS_FILE)
+    if os.getenv("FAQ_FAST_PATH", "1") == "1" else None
+)
+FAQ_VOICE = os.getenv("FAQ_VOICE")
+
+# Multi-turn history per caller, replayed on the caller's llama-server slot
+# (LLM_CONTEXT_SIZE = tokens per slot, i.e. llama-server -c divided by -np)
+conversations = ConversationStore(
+    idle_timeout=float(os.getenv("CONVERSATION_IDLE_SECONDS", "900")),
+    context_size=int(os.getenv("LLM_CONTEXT_SIZE", "2048")),
+    slots=[int(s) for s in os.getenv("LLM_CONVERSATION_SLOTS", "").split(",") if s.strip()]
+)
+
+def forget_audio(name):
+    """Drop every reference to an evicted audio file"""
+    response_cache.forget_audio(name)
+    if intent_classifier:
+        intent_classifier.forget_audio(name)
+
+# Generated response audio, content-addressed and evicted by age/size
+audio_store = AudioStore(
+    directory=os.getenv("AUDIO_STORE_DIR", "audio_store"),
+    max_bytes=int(float(os.getenv("AUDIO_STORE_MAX_MB", "500")) * 1024 * 1024),
+    max_age=float(os.getenv("AUDIO_STORE_MAX_AGE_HOURS", "24")) * 3600,
+    on_evict=forget_audio
+)
+AUDIO_CACHE_SECONDS = int(os.getenv("AUDIO_CACHE_SECONDS", "86400"))
+
+async def faq_audio(tts_service, match, voice, reference):
+    """Stored audio for a templated answer, rendered on first use; None if TTS fails"""
+    voice = "agent" if FAQ_VOICE else voice
+    name = intent_classifier.get_audio(match, voice)
+    if name and audio_store.touch(name):
+        return name
+    output_file = audio_store.temp_path()
+    ok = await inference.run(
+        "tts",
+        tts_service.speak,
+        match.answer,
+        output_file=output_file,
+        speaker_wav=FAQ_VOICE or reference,
+        language=match.language,
+        play_audio=False
+    )
+    if not ok:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return None
+    name = await asyncio.to_thread(audio_store.put, output_file)
+    intent_classifier.set_audio(match, voice, name)
+    return name
+
+async def prerender_faq():
+    """Render every templated answer in the agent voice ahead of the first caller"""
+    tts_service = await model("tts")
+    rendered = 0
+    for match in intent_classifier.answers():
+        if await faq_audio(tts_service, match, None, None):
+            rendered += 1
+    print(f"✅ Pre-rendered {rendered} FAQ answer(s)")
+
+# Overlap LLM generation and TTS synthesis sentence by sentence
+PIPELINED_TTS = os.getenv("PIPELINED_TTS", "1") == "1"
+
+# Crop recordings to their speech regions before ASR; the cloning reference
+# is the speech-only audio, capped at REFERENCE_MAX_SECONDS
+TRIM_SILENCE = os.getenv("TRIM_SILENCE", "1") == "1"
+REFERENCE_MAX_SECONDS = float(os.getenv("REFERENCE_MAX_SECONDS", "12"))
+
+def prefetch(iterable, executor=None):
+    """Start draining an iterator in the background now; returns an async iterator of its items
+    
+    The worker starts before the first item is awaited, so e.g. an LLM
+    stream is already generating while the caller waits on something else.
+    Exceptions raised by the iterator are re-raised to the consumer. If the
+    consumer stops early, the iterator is closed after its next item.
+    
+    Args:
+        iterable: Iterator to drain
+        executor: Run the worker on this executor instead of a new thread
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+    
+    def worker():
+        error = None
+        try:
+            for item in iterable:
+                loop.call_soon_threadsafe(items.put_nowait, (item, None))
+                if stop.is_set():
+                    break
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+            loop.call_soon_threadsafe(items.put_nowait, (done, error))
+    
+    async def consume():
+        try:
+            while True:
+                item, error = await items.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    return
+                yield item
+        finally:
+            stop.set()
+    
+    if executor is not None:
+        executor.submit(worker)
+    else:
+        threading.Thread(target=worker, daemon=True).start()
+    return consume()
 
 @app.get("/", response_class=HTMLResponse)
 async def home():
@@ -188,6 +386,9 @@ async def home():
                 <button id="recordBtn" onclick="toggleRecording()">
                     <span class="icon">🎤</span> Start Recording
                 </button>
+                <button id="liveBtn" onclick="toggleLive()" style="margin-top: 15px;">
+                    <span class="icon">📞</span> Live Conversation
+                </button>
             </div>
             
             <div id="status" class="status"></div>
@@ -200,6 +401,12 @@ async def home():
             let mediaRecorder;
             let audioChunks = [];
             let isRecording = false;
+            // Lets the server remember this caller's language between recordings
+            let sessionId = sessionStorage.getItem('sessionId');
+            if (!sessionId) {
+                sessionId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+                sessionStorage.setItem('sessionId', sessionId);
+            }
 
             async function toggleRecording() {
                 const btn = document.getElementById('recordBtn');
@@ -267,6 +474,7 @@ async def home():
                 try {
                     const formData = new FormData();
                     formData.append('file', audioBlob, 'recording.webm');
+                    formData.append('session_id', sessionId);
                     
                     status.innerHTML = '<span class="icon">🔄</span> Transcribing via Pipecat pipeline<span class="loading"></span>';
                     
@@ -275,6 +483,11 @@ async def home():
                         body: formData
                     });
                     
+                    if (res.status === 503) {
+                        const retryAfter = res.headers.get('Retry-After') || 'a few';
+                        throw new Error(`Server is busy, please try again in ${retryAfter} seconds`);
+                    }
+                    
                     if (!res.ok) {
                         throw new Error('Server error: ' + res.statusText);
                     }
@@ -316,97 +529,659 @@ async def home():
                     console.error(err);
                 }
             }
+
+            // Live conversation over /ws: stream 16 kHz int16 PCM, play back WAV chunks
+            let liveSocket = null;
+            let liveContext = null;
+            let liveStream = null;
+            let playbackQueue = [];
+            let playing = false;
+
+            function playNext() {
+                const audioPlayer = document.getElementById('audioPlayer');
+                if (playing || playbackQueue.length === 0) return;
+                playing = true;
+                audioPlayer.src = URL.createObjectURL(playbackQueue.shift());
+                audioPlayer.style.display = 'block';
+                audioPlayer.onended = () => { playing = false; playNext(); };
+                audioPlayer.play();
+            }
+
+            function stopPlayback() {
+                const audioPlayer = document.getElementById('audioPlayer');
+                playbackQueue = [];
+                playing = false;
+                audioPlayer.pause();
+            }
+
+            async function toggleLive() {
+                const btn = document.getElementById('liveBtn');
+                const status = document.getElementById('status');
+                const transcript = document.getElementById('transcript');
+                const response = document.getElementById('response');
+
+                if (liveSocket) {
+                    liveSocket.close();
+                    return;
+                }
+
+                try {
+                    liveStream = await navigator.mediaDevices.getUserMedia({ audio: { channelCount: 1 } });
+                } catch (err) {
+                    alert('❌ Microphone access denied: ' + err.message);
+                    return;
+                }
+
+                const protocol = location.protocol === 'https:' ? 'wss://' : 'ws://';
+                liveSocket = new WebSocket(protocol + location.host + '/ws');
+                liveSocket.binaryType = 'blob';
+
+                liveSocket.onmessage = (event) => {
+                    if (event.data instanceof Blob) {
+                        playbackQueue.push(event.data);
+                        playNext();
+                        return;
+                    }
+                    const msg = JSON.parse(event.data);
+                    if (msg.type === 'speech_start' || msg.type === 'interrupted') {
+                        stopPlayback();
+                        status.innerHTML = '<span class="icon">🎤</span> Listening...';
+                    } else if (msg.type === 'partial') {
+                        transcript.style.display = 'block';
+                        transcript.innerHTML = `<span class="icon">📝</span> <em>${msg.text}</em>`;
+                    } else if (msg.type === 'transcript') {
+                        transcript.style.display = 'block';
+                        transcript.innerHTML = `<div><span class="icon">🌐</span> <strong>Language:</strong> ${msg.language}</div>
+                            <div style="margin-top: 10px;"><span class="icon">📝</span> <strong>You said:</strong> "${msg.text}"</div>`;
+                        response.style.display = 'block';
+                        response.innerHTML = '<span class="icon">💬</span> <strong>Assistant:</strong> ';
+                        status.innerHTML = '<span class="icon">⏳</span> Responding<span class="loading"></span>';
+                    } else if (msg.type === 'response') {
+                        response.innerHTML += msg.text + ' ';
+                    } else if (msg.type === 'response_end') {
+                        status.innerHTML = '<span class="icon">🎤</span> Listening...';
+                    } else if (msg.type === 'error') {
+                        status.innerHTML = '<span class="icon">❌</span> Error: ' + msg.error;
+                    }
+                };
+
+                liveSocket.onopen = () => {
+                    liveContext = new AudioContext();
+                    const source = liveContext.createMediaStreamSource(liveStream);
+                    const processor = liveContext.createScriptProcessor(4096, 1, 1);
+                    const ratio = liveContext.sampleRate / 16000;
+                    processor.onaudioprocess = (e) => {
+                        if (!liveSocket || liveSocket.readyState !== WebSocket.OPEN) return;
+                        const input = e.inputBuffer.getChannelData(0);
+                        const out = new Int16Array(Math.floor(input.length / ratio));
+                        for (let i = 0; i < out.length; i++) {
+                            const sample = Math.max(-1, Math.min(1, input[Math.floor(i * ratio)]));
+                            out[i] = sample * 0x7fff;
+                        }
+                        liveSocket.send(out.buffer);
+                    };
+                    source.connect(processor);
+                    processor.connect(liveContext.destination);
+
+                    btn.innerHTML = '<span class="icon">⏹️</span> End Conversation';
+                    btn.classList.add('recording');
+                    document.getElementById('recordBtn').disabled = true;
+                    status.style.display = 'block';
+                    status.innerHTML = '<span class="icon">🎤</span> Listening...';
+                };
+
+                liveSocket.onclose = () => {
+                    if (liveContext) liveContext.close();
+                    liveStream.getTracks().forEach(track => track.stop());
+                    liveSocket = null;
+                    liveContext = null;
+                    btn.innerHTML = '<span class="icon">📞</span> Live Conversation';
+                    btn.classList.remove('recording');
+                    document.getElementById('recordBtn').disabled = false;
+                    status.innerHTML = '<span class="icon">👋</span> Conversation ended';
+                };
+            }
         </script>
     </body>
     </html>
     """
 
 @app.post("/process-audio")
-async def process_audio(file: UploadFile = File(...)):
+async def process_audio(file: UploadFile = File(...), session_id: str = Form(None)):
     """Process uploaded audio through Pipecat pipeline"""
     try:
-        print(f"\n📥 Received: {file.filename} ({file.content_type})")
-        
-        # Save uploaded file
-        temp_file = "temp_upload_raw.webm"
-        content = await file.read()
-        with open(temp_file, "wb") as f:
-            f.write(content)
-        print(f"✅ Saved {len(content)} bytes")
-        
-        # Convert to WAV
-        print("🔄 Converting to WAV...")
-        from pydub import AudioSegment
-        audio = AudioSegment.from_file(temp_file)
-        audio_file = "temp_upload.wav"
-        audio.export(audio_file, format="wav", parameters=["-ar", "16000", "-ac", "1"])
-        print(f"✅ Converted to {audio_file}")
-        
-        # Transcribe with Whisper
-        print("🔄 Transcribing via Pipecat...")
-        user_text, detected_lang = whisper_service.transcribe(audio_file)
-        print(f"✅ Transcribed: '{user_text}' (lang: {detected_lang})")
-        
-        lang_names = {"en": "English", "hi": "Hindi", "te": "Telugu"}
-        
+        async with inference.admit():
+            return await run_pipeline(file, session_id)
+    except ServerBusy as e:
+        print(f"⚠️ Rejecting request: {e}")
+        return busy_response(e)
+    except Exception as e:
+        import traceback
+        error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
+        print(f"❌ {error_msg}")
+        return {
+            "error": str(e),
+            "transcript": "",
+            "language": "",
+            "response": ""
+        }
+
+def busy_response(error):
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Server busy, please retry", "retry_after": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+async def run_pipeline(file, session_id=None):
+    """ASR -> LLM -> TTS for one uploaded recording, on the inference executors"""
+    print(f"\n📥 Received: {file.filename} ({file.content_type})")
+    
+    content = await file.read()
+    print(f"✅ Received {len(content)} bytes")
+    
+    # Decode straight to a 16 kHz float32 buffer (no temp files, so
+    # concurrent requests can't overwrite each other's audio)
+    print("🔄 Decoding audio...")
+    audio = await inference.run("decode", decode_audio, content)
+    print(f"✅ Decoded {len(audio) / 16000:.1f}s of audio")
+    
+    whisper_service, tts_service, llm_service = await model("asr"), await model("tts"), await model("llm")
+    
+    # Leading/trailing silence costs decode time and makes Whisper hallucinate
+    if TRIM_SILENCE:
+        vad_service = await model("vad")
+        audio = await inference.run("vad", vad_service.trim_silence, audio)
+        print(f"✂️ Kept {len(audio) / 16000:.1f}s of speech")
+        if len(audio) == 0:
+            return {"error": "No speech detected", "transcript": "", "language": "", "response": ""}
+    reference = audio[:int(REFERENCE_MAX_SECONDS * 16000)]
+    
+    # Transcribe with Whisper
+    print("🔄 Transcribing via Pipecat...")
+    known_lang = session_languages.get(session_id)
+    user_text, detected_lang = await inference.run("asr", whisper_service.transcribe, audio, language=known_lang)
+    print(f"✅ Transcribed: '{user_text}' (lang: {detected_lang}{', from session' if known_lang else ''})")
+    if user_text:
+        session_languages.set(session_id, detected_lang)
+    
+    lang_names = {"en": "English", "hi": "Hindi", "te": "Telugu"}
+    conversation = conversations.get(session_id) if session_id else None
+    # Cached answers have no context, so only a conversation's first turn uses the cache
+    first_turn = conversation is None or not conversation.turns
+    voice = tts_service.reference_key(reference, 16000)
+    
+    # Clear FAQ questions skip the LLM (and TTS once the answer is rendered)
+    faq = intent_classifier.match(user_text, detected_lang) if intent_classifier and user_text else None
+    if faq:
+        if conversation is not None:
+            conversation.add_turn(user_text, faq.answer)
+        return {
+            "transcript": user_text,
+            "language": lang_names.get(detected_lang, detected_lang),
+            "response": faq.answer,
+            "audio_file": await faq_audio(tts_service, faq, voice, reference),
+            "intent": faq.intent
+        }
+    
+    # Repeated queries (e.g. during an outage) skip the LLM, and TTS too when
+    # audio for this voice is already rendered
+    cached = response_cache.get(user_text, detected_lang, voice) if first_turn else None
+    if cached and conversation is not None:
+        conversation.add_turn(user_text, cached[0])
+    if cached and cached[1] and audio_store.touch(cached[1]):
+        response, output_file = cached
+        print(f"⚡ Response cache hit, reusing {output_file}")
+        return {
+            "transcript": user_text,
+            "language": lang_names.get(detected_lang, detected_lang),
+            "response": response,
+            "audio_file": output_file
+        }
+    elif cached and cached[1]:
+        response_cache.forget_audio(cached[1])
+    
+    output_file = audio_store.temp_path()
+    
+    if cached:
+        response = cached[0]
+        print(f"⚡ Response cache hit (text only): '{response}'")
+        print("🔊 Generating speech...")
+        tts_success = await inference.run(
+            "tts",
+            tts_service.speak,
+            response,
+            output_file=output_file,
+            speaker_wav=reference,
+            language=detected_lang,
+            play_audio=False
+        )
+    elif PIPELINED_TTS:
+        # The LLM starts generating on its own executor right away, and each
+        # finished sentence is a separate TTS job, so sentence N+1 is generated
+        # while sentence N is synthesized and the TTS worker is free between
+        # sentences for other requests
+        print("🤔🔊 Generating response and speech (pipelined)...")
+        stream = llm_service.generate_stream(
+            user_text, language=detected_lang, by_sentence=True, conversation=conversation
+        )
+        sentences = []
+        segment_files = []
+        try:
+            async for sentence in prefetch(stream, executor=inference.executors["llm"]):
+                sentences.append(sentence)
+                segment_file = audio_store.temp_path()
+                if await inference.run(
+                    "tts",
+                    tts_service.speak,
+                    sentence,
+                    output_file=segment_file,
+                    speaker_wav=reference,
+                    language=detected_lang,
+                    play_audio=False
+                ):
+                    segment_files.append(segment_file)
+                else:
+                    print(f"⚠️ Skipping sentence {len(sentences) - 1} (synthesis failed)")
+            tts_success = await asyncio.to_thread(tts_service.stitch, segment_files, output_file)
+        except LLMError as e:
+            # Nothing half-spoken is returned or cached
+            print(f"❌ {e}")
+            return {
+                "error": str(e),
+                "transcript": user_text,
+                "language": lang_names.get(detected_lang, detected_lang),
+                "response": "",
+                "audio_file": None
+            }
+        finally:
+            for segment_file in segment_files:
+                if os.path.exists(segment_file):
+                    os.remove(segment_file)
+        response = " ".join(sentences)
+        print(f"✅ Response: '{response}'")
+    else:
         # Generate LLM response
         print("🤔 Generating response via Pipecat pipeline...")
-        response = llm_service.generate_response(user_text, language=detected_lang)
+        response = await llm_service.agenerate_response(user_text, language=detected_lang, conversation=conversation)
         print(f"✅ Response: '{response}'")
         
         # Generate TTS
         print("🔊 Generating speech...")
-        import time
-        output_file = f"response_{int(time.time())}.wav"
-        tts_success = tts_service.speak(
+        tts_success = await inference.run(
+            "tts",
+            tts_service.speak,
             response, 
             output_file=output_file, 
-            speaker_wav=audio_file, 
+            speaker_wav=reference, 
             language=detected_lang, 
             play_audio=False
         )
+    
+    if tts_success:
+        output_file = await asyncio.to_thread(audio_store.put, output_file)
+        print(f"✅ Speech saved to {output_file}")
+    else:
+        print(f"❌ Speech generation failed!")
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        output_file = None
+    if first_turn:
+        response_cache.put(user_text, detected_lang, response, voice, output_file)
+    
+    return {
+        "transcript": user_text,
+        "language": lang_names.get(detected_lang, detected_lang),
+        "response": response,
+        "audio_file": output_file
+    }
+
+# Live (WebSocket) conversation settings
+WS_SAMPLE_RATE = 16000
+WS_VAD_WINDOW = 512            # Silero expects 512-sample windows at 16 kHz
+WS_END_SILENCE = 0.8           # Seconds of silence that end an utterance
+WS_PARTIAL_INTERVAL = 1.0      # Seconds of new speech between partial transcripts
+WS_PRE_ROLL = 0.3              # Audio kept from before speech onset
+MIN_REFERENCE_SECONDS = 3.0    # Shortest utterance pinned as the voice-cloning reference
+
+class VoiceSocketSession:
+    """One live conversation on /ws
+    
+    The client streams 16 kHz mono PCM (int16, binary messages). The server
+    runs VAD on the incoming frames, sends partial transcripts while the user
+    is speaking, and once the utterance ends streams back the transcript,
+    response sentences (JSON) and one WAV chunk per sentence (binary).
+    
+    Speaking while a response is still being sent interrupts it (barge-in).
+    """
+    def __init__(self, websocket):
+        self.ws = websocket
+        self.session_id = uuid.uuid4().hex[:8]
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.pre_roll = deque(maxlen=max(1, int(WS_PRE_ROLL * WS_SAMPLE_RATE / WS_VAD_WINDOW)))
+        self.utterance = []
+        self.in_speech = False
+        self.silent_windows = 0
+        self.samples_since_partial = 0
+        self.partial_task = None
+        self.response_task = None
+        self.end_silence_windows = int(WS_END_SILENCE * WS_SAMPLE_RATE / WS_VAD_WINDOW)
+        # This session's own Silero state (VADService.stream), created with the first audio
+        self.vad = None
+        # Voice-cloning reference, pinned once long enough so later turns
+        # reuse the cached XTTS latents instead of re-encoding every utterance
+        self.speaker_reference = None
+        # Detected on the first transcribed utterance, then reused for every decode
+        self.language = None
+        self.conversation = conversations.get(self.session_id)
+    
+    async def send_json(self, message):
+        await self.ws.send_json(message)
+    
+    async def run(self):
+        await self.send_json({"type": "ready", "sample_rate": WS_SAMPLE_RATE})
+        try:
+            while True:
+                message = await self.ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    pcm = np.frombuffer(message["bytes"], dtype=np.int16).astype(np.float32) / 32768.0
+                    await self.feed(pcm)
+                elif message.get("text"):
+                    control = json.loads(message["text"])
+                    if control.get("type") == "stop" and self.utterance:
+                        # Client says the user is done talking; don't wait for silence
+                        await self.end_utterance()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in (self.partial_task, self.response_task):
+                if task and not task.done():
+                    task.cancel()
+            conversations.drop(self.session_id)
+            print(f"🔌 Live session {self.session_id} closed")
+    
+    async def feed(self, pcm):
+        """Run VAD over newly received audio, window by window"""
+        self.pending = np.concatenate([self.pending, pcm])
+        n_windows = len(self.pending) // WS_VAD_WINDOW
+        if n_windows == 0:
+            return
+        windows = self.pending[:n_windows * WS_VAD_WINDOW].reshape(n_windows, WS_VAD_WINDOW)
+        self.pending = self.pending[n_windows * WS_VAD_WINDOW:]
         
-        if tts_success:
-            print(f"✅ Speech saved to {output_file}")
-        else:
-            print(f"❌ Speech generation failed!")
-            output_file = None
+        if self.vad is None:
+            self.vad = (await model("vad")).stream()
+        flags = await inference.run(
+            "vad", lambda: [self.vad.is_speech(window)[0] for window in windows]
+        )
         
-        return {
-            "transcript": user_text,
-            "language": lang_names.get(detected_lang, detected_lang),
-            "response": response,
-            "audio_file": output_file
-        }
+        for window, is_speech in zip(windows, flags):
+            if not self.in_speech:
+                self.pre_roll.append(window)
+                if is_speech:
+                    await self.start_utterance()
+                continue
+            
+            self.utterance.append(window)
+            self.samples_since_partial += len(window)
+            self.silent_windows = 0 if is_speech else self.silent_windows + 1
+            if self.silent_windows >= self.end_silence_windows:
+                await self.end_utterance()
         
-    except Exception as e:
-        import traceback
-        error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
-        print(f"❌ {error_msg}")
-        return {
-            "error": str(e),
-            "transcript": "",
-            "language": "",
-            "response": ""
-        }
+        if self.in_speech and self.samples_since_partial >= WS_PARTIAL_INTERVAL * WS_SAMPLE_RATE:
+            self.request_partial()
+    
+    async def start_utterance(self):
+        if self.response_task and not self.response_task.done():
+            self.response_task.cancel()
+            await self.send_json({"type": "interrupted"})
+        self.in_speech = True
+        self.silent_windows = 0
+        self.samples_since_partial = 0
+        self.utterance = list(self.pre_roll)
+        self.pre_roll.clear()
+        await self.send_json({"type": "speech_start"})
+    
+    def request_partial(self):
+        """Re-decode the utterance so far, unless a decode is already running
+        
+        Partials are best-effort: they are skipped while every request slot
+        is taken, and otherwise hold a slot like a final decode does.
+        """
+        if self.partial_task and not self.partial_task.done():
+            return
+        if inference.saturated():
+            return
+        self.samples_since_partial = 0
+        audio = np.concatenate(self.utterance)
+        
+        async def partial():
+            async with inference.admit():
+                whisper_service = await model("asr")
+                text, _ = await inference.run("asr", whisper_service.transcribe, audio, language=self.language)
+            if self.in_speech and text:
+                await self.send_json({"type": "partial", "text": text})
+        
+        self.partial_task = asyncio.create_task(partial())
+        self.partial_task.add_done_callback(self.partial_done)
+    
+    def partial_done(self, task):
+        """Retrieve a partial decode's exception so it is logged instead of lost"""
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ [{self.session_id}] Partial transcript failed: {task.exception()}")
+    
+    async def end_utterance(self):
+        audio = np.concatenate(self.utterance)
+        self.in_speech = False
+        self.utterance = []
+        if self.partial_task and not self.partial_task.done():
+            self.partial_task.cancel()
+        self.response_task = asyncio.create_task(self.respond(audio))
+    
+    async def respond(self, audio):
+        """Transcribe the finished utterance and stream the response back"""
+        try:
+            async with inference.admit():
+                await self.answer(audio)
+        except ServerBusy as e:
+            print(f"⚠️ [{self.session_id}] Rejecting utterance: {e}")
+            await self.send_json({"type": "error", "error": "Server busy, please retry", "retry_after": e.retry_after})
+    
+    async def answer(self, audio):
+        try:
+            whisper_service, tts_service, llm_service = await model("asr"), await model("tts"), await model("llm")
+            if TRIM_SILENCE:
+                vad_service = await model("vad")
+                audio = await inference.run("vad", vad_service.trim_silence, audio)
+                if len(audio) == 0:
+                    await self.send_json({"type": "transcript", "text": "", "language": self.language or ""})
+                    return
+            user_text, detected_lang = await inference.run(
+                "asr", whisper_service.transcribe, audio, language=self.language
+            )
+            if user_text:
+                self.language = detected_lang
+            print(f"✅ [{self.session_id}] Transcribed: '{user_text}' (lang: {detected_lang})")
+            await self.send_json({"type": "transcript", "text": user_text, "language": detected_lang})
+            if not user_text:
+                return
+            
+            if self.speaker_reference is None or len(self.speaker_reference) < MIN_REFERENCE_SECONDS * WS_SAMPLE_RATE:
+                self.speaker_reference = audio[:int(REFERENCE_MAX_SECONDS * WS_SAMPLE_RATE)]
+            
+            voice = tts_service.reference_key(self.speaker_reference, WS_SAMPLE_RATE)
+            faq = intent_classifier.match(user_text, detected_lang) if intent_classifier else None
+            if faq:
+                self.conversation.add_turn(user_text, faq.answer)
+                await self.send_json({"type": "response", "text": faq.answer, "intent": faq.intent})
+                name = await faq_audio(tts_service, faq, voice, self.speaker_reference)
+                faq_file = audio_store.path(name) if name else None
+                if faq_file:
+                    await self.ws.send_bytes(faq_file.read_bytes())
+                await self.send_json({"type": "response_end"})
+                return
+            
+            first_turn = not self.conversation.turns
+            cached = response_cache.get(user_text, detected_lang, voice) if first_turn else None
+            if cached:
+                self.conversation.add_turn(user_text, cached[0])
+            cached_audio = audio_store.path(cached[1]) if cached and cached[1] else None
+            if cached_audio:
+                print(f"⚡ [{self.session_id}] Response cache hit, reusing {cached[1]}")
+                audio_store.touch(cached[1])
+                await self.send_json({"type": "response", "text": cached[0]})
+                await self.ws.send_bytes(cached_audio.read_bytes())
+                await self.send_json({"type": "response_end"})
+                return
+            
+            if cached:
+                print(f"⚡ [{self.session_id}] Response cache hit (text only)")
+                sentences = replay_sentences(cached[0])
+            else:
+                # llama-server keeps generating the next sentence while this one is synthesized
+                sentences = llm_service.agenerate_stream(
+                    user_text, language=detected_lang, by_sentence=True, conversation=self.conversation
+                )
+            spoken = []
+            i = 0
+            async for sentence in sentences:
+                i += 1
+                spoken.append(sentence)
+                await self.send_json({"type": "response", "text": sentence})
+                segment_file = audio_store.temp_path()
+                ok = await inference.run(
+                    "tts", tts_service.speak, sentence, output_file=segment_file,
+                    speaker_wav=self.speaker_reference, language=detected_lang, play_audio=False
+                )
+                if ok:
+                    wav_bytes = Path(segment_file).read_bytes()
+                    os.remove(segment_file)
+                    await self.ws.send_bytes(wav_bytes)
+            await self.send_json({"type": "response_end"})
+            if first_turn and not cached:
+                response_cache.put(user_text, detected_lang, " ".join(spoken), voice)
+        except asyncio.CancelledError:
+            print(f"✋ [{self.session_id}] Response interrupted")
+            raise
+        except Exception as e:
+            print(f"❌ [{self.session_id}] {e}")
+            await self.send_json({"type": "error", "error": str(e)})
+
+async def replay_sentences(text):
+    """Split a cached response the same way a streamed one would be"""
+    for sentence in stream_sentences([text]):
+        yield sentence
+
+@app.websocket("/ws")
+async def voice_socket(websocket: WebSocket):
+    """Full-duplex live conversation (see VoiceSocketSession)"""
+    await websocket.accept()
+    session = VoiceSocketSession(websocket)
+    print(f"🔌 Live session {session.session_id} connected")
+    await session.run()
 
 @app.get("/audio/{filename}")
-async def get_audio(filename: str):
-    """Serve generated audio files"""
-    file_path = Path(filename)
-    if file_path.exists():
-        print(f"✅ Serving audio file: {filename}")
-        return FileResponse(str(file_path), media_type="audio/wav")
-    else:
+async def get_audio(filename: str, request: Request):
+    """Serve generated audio files from the audio store
+    
+    Names are content hashes, so the name doubles as a strong ETag and the
+    file can be cached as immutable. Single byte ranges are supported so
+    players can seek and interrupted downloads can resume.
+    """
+    file_path = audio_store.path(filename)
+    if file_path is None:
         print(f"❌ Audio file not found: {filename}")
-        print(f"   Current directory: {Path.cwd()}")
-        print(f"   Looking for: {file_path.absolute()}")
-        return {"error": "File not found"}
+        return JSONResponse(status_code=404, content={"error": "File not found"})
+    
+    etag = f'"{filename[:-len(".wav")]}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"public, max-age={AUDIO_CACHE_SECONDS}, immutable"
+    }
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    size = file_path.stat().st_size
+    range_header = request.headers.get("range", "")
+    if request.headers.get("if-range", etag) != etag:
+        range_header = ""  # The client's partial copy is of different content
+    
+    # Multi-range requests are answered with the whole file
+    byte_range = None
+    if range_header.startswith("bytes=") and "," not in range_header:
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    
+    if byte_range is not None:
+        start, end = byte_range
+        with open(file_path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(content=data, status_code=206, media_type="audio/wav", headers=headers)
+    
+    print(f"✅ Serving audio file: {filename}")
+    return FileResponse(str(file_path), media_type="audio/wav", headers=headers)
+
+def parse_range(header, size):
+    """Parse a single "bytes=start-end" range; None if malformed or unsatisfiable"""
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the server is up, models may still be loading"""
+    loaded = models.loaded()
+    content = {"status": "ok", "models": models.status(), "inference": inference.status()}
+    if "llm" in loaded:
+        content["llm_backends"] = loaded["llm"].status()
+    if intent_classifier:
+        content["faq"] = intent_classifier.stats()
+    return content
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: every model is loaded and warmed up"""
+    ready = models.ready()
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "models": models.status()})
+
+@app.on_event("startup")
+async def startup():
+    """Start loading models in the background"""
+    if PRELOAD_MODELS:
+        models.preload()
+    if intent_classifier and FAQ_VOICE:
+        app.state.prerender_faq = asyncio.create_task(prerender_faq())
 
 @app.on_event("shutdown")
 async def shutdown():
     """Cleanup on shutdown"""
-    tts_service.cleanup()
+    loaded = models.loaded()
+    if "tts" in loaded:
+        loaded["tts"].cleanup()
+    inference.shutdown()
+    if "llm" in loaded:
+        await loaded["llm"].aclose()
+        loaded["llm"].close()
     print("✅ Cleaned up resources")
 
 if __name__ == "__main__":